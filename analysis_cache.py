@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from metrics import CACHE_LOOKUPS
+from config import Config
+
+
+# Digests computed elsewhere (e.g. while a chunked upload arrived), keyed on
+# path and checked against size and mtime so a changed file is hashed again
+_known_digests = {}
+_known_digests_lock = threading.Lock()
+KNOWN_DIGESTS_MAX = 1024
+
+
+def remember_digest(filepath, digest):
+    stat = os.stat(filepath)
+    with _known_digests_lock:
+        _known_digests.pop(filepath, None)
+        _known_digests[filepath] = (stat.st_size, stat.st_mtime_ns, digest)
+        while len(_known_digests) > KNOWN_DIGESTS_MAX:
+            del _known_digests[next(iter(_known_digests))]
+
+
+def file_digest(filepath, chunk_size=1024 * 1024):
+    known = _known_digests.get(filepath)
+    if known is not None:
+        stat = os.stat(filepath)
+        if known[:2] == (stat.st_size, stat.st_mtime_ns):
+            return known[2]
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def cache_key(*parts):
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    """SQLite-backed cache of analysis results with size- and age-based LRU eviction.
+
+    Entries live in namespaces: 'document' holds the suggestions for a whole
+    file, 'paragraph' holds raw NER entities for a single paragraph so edited
+    re-uploads only send the changed paragraphs back through the model.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, max_age=30 * 24 * 3600, evict_every=100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,'
+            ' size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL,'
+            ' PRIMARY KEY (namespace, key))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self._conn.commit()
+
+    def get(self, namespace, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, created FROM entries WHERE namespace = ? AND key = ?', (namespace, key)
+            ).fetchone()
+            now = time.time()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache=f'analysis_{namespace}', result='miss')
+                return None
+            self._conn.execute(
+                'UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?', (now, namespace, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        CACHE_LOOKUPS.inc(cache=f'analysis_{namespace}', result='hit')
+        return json.loads(zlib.decompress(row[0]))
+
+    def get_many(self, namespace, keys):
+        # Returns {key: value} for the keys present; one query for a batch of paragraphs
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f'SELECT key, value FROM entries WHERE namespace = ? AND key IN ({placeholders})'
+                    ' AND created >= ?',
+                    [namespace, *batch, now - self.max_age],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = blob
+            self._conn.executemany(
+                'UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?',
+                [(now, namespace, key) for key in found],
+            )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        CACHE_LOOKUPS.inc(len(found), cache=f'analysis_{namespace}', result='hit')
+        CACHE_LOOKUPS.inc(len(keys) - len(found), cache=f'analysis_{namespace}', result='miss')
+        return {key: json.loads(zlib.decompress(blob)) for key, blob in found.items()}
+
+    def put(self, namespace, key, value):
+        self.put_many(namespace, [(key, value)])
+
+    def put_many(self, namespace, items):
+        now = time.time()
+        rows = []
+        for key, value in items:
+            blob = zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+            rows.append((namespace, key, blob, len(blob), now, now))
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO entries (namespace, key, value, size, created, accessed)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                rows,
+            )
+            self._conn.commit()
+            self._puts += 1
+            if self._puts % self.evict_every == 0:
+                self._evict()
+
+    def evict(self):
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        self._conn.execute('DELETE FROM entries WHERE created < ?', (now - self.max_age,))
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total > self.max_bytes:
+            # Drop least recently used entries until we are back under the budget
+            excess = total - self.max_bytes
+            rows = self._conn.execute('SELECT namespace, key, size FROM entries ORDER BY accessed').fetchall()
+            doomed = []
+            for namespace, key, size in rows:
+                if excess <= 0:
+                    break
+                doomed.append((namespace, key))
+                excess -= size
+            self._conn.executemany('DELETE FROM entries WHERE namespace = ? AND key = ?', doomed)
+        self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            count, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'entries': count, 'bytes': size, 'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM entries')
+            self._conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if not Config.ANALYSIS_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnalysisCache(
+                Config.ANALYSIS_CACHE_PATH,
+                max_bytes=Config.ANALYSIS_CACHE_MAX_BYTES,
+                max_age=Config.ANALYSIS_CACHE_MAX_AGE,
+            )
+    return _cache
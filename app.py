@@ -1,11 +1,22 @@
-from flask import Flask, render_template, request, send_file, session, flash, redirect, url_for, jsonify
+from flask import Flask, render_template, request, send_file, session, flash, redirect, url_for, jsonify, g, Response
 from werkzeug.utils import secure_filename
+from werkzeug.http import parse_content_range_header
 import os
 import uuid
-import json
 import logging
+from contextlib import ExitStack
 from logging.handlers import RotatingFileHandler
-from redactor import analyze_document, redact_document, restore_document, get_preview, generate_token_for_term, search_document
+from redactor import analyze_document, redact_document, restore_document, redacted_path, redaction_replacements, generate_token_for_term, search_document
+from nlp_pool import configured_fast_model, get_pool, load_fast_model, load_model
+from jobs import get_job_manager, get_batch_manager
+from search_index import get_search_index
+from preview_engine import get_preview_engine
+from token_store import get_token_store
+from batch import run_batch
+from storage import get_storage, start_sweeper
+from uploads import get_upload_manager, UploadError
+from gazetteer import get_gazetteer
+from metrics import REGISTRY, REQUEST_SECONDS, trace_logger, start_trace, finish_trace, tracing, profiling
 from config import Config
 
 app = Flask(__name__)
@@ -27,12 +38,98 @@ app.logger.addHandler(file_handler)
 app.logger.setLevel(logging.INFO)
 app.logger.info('Redaction tool startup')
 
+# One JSON object per line for each request and background job (see metrics.py)
+if app.config['TRACE_LOG']:
+    trace_handler = RotatingFileHandler(app.config['TRACE_LOG'], maxBytes=10 * 1024 * 1024, backupCount=5)
+    trace_handler.setFormatter(logging.Formatter('%(message)s'))
+    trace_logger.addHandler(trace_handler)
+    trace_logger.setLevel(logging.INFO)
+
+# Start loading the NLP model in the background. With NLP_PRELOAD only the model
+# (and the fast-tier pipeline, if any) is loaded here, before gunicorn --preload
+# forks the web workers, so they share it; each worker starts its own pool on
+# first use (processes and threads do not survive the fork)
+if app.config['NLP_PRELOAD']:
+    load_model()
+    if configured_fast_model():
+        load_fast_model(configured_fast_model())
+else:
+    get_pool()
+
+# Pick up redaction maps left in UPLOAD_FOLDER by earlier versions
+get_storage().import_legacy_maps(app.config['UPLOAD_FOLDER'])
+
+@app.before_request
+def ensure_sweeper():
+    # Sweep expired sessions and stale uploads in the background. Started from the
+    # first request rather than at import, so each gunicorn worker runs its own
+    # after the fork (threads do not survive it)
+    start_sweeper(log=app.logger)
+
+def profile_requested():
+    return app.config['PROFILING_ENABLED'] and (
+        request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1')
+
+@app.before_request
+def begin_trace():
+    if request.endpoint == 'static':
+        return
+    g.trace, g.trace_token = start_trace('request', method=request.method, path=request.path,
+                                         endpoint=request.endpoint, file_id=session.get('file_id'))
+    g.profile = ExitStack()
+    if profile_requested():
+        g.profile.enter_context(profiling(f"request_{g.trace.id}"))
+
+@app.teardown_request
+def end_trace(error=None):
+    trace = g.pop('trace', None)
+    if trace is None:
+        return
+    g.pop('profile').close()
+    status = g.pop('status', 500 if error else 200)
+    trace.fields['status'] = status
+    if error is not None:
+        trace.fields['error'] = str(error)
+    REQUEST_SECONDS.observe(trace.elapsed(), endpoint=request.endpoint or 'unknown',
+                            method=request.method, status=status)
+    finish_trace(trace, g.pop('trace_token'))
+
+@app.after_request
+def record_status(response):
+    g.status = response.status_code
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def reset_session():
+    # Starting over ends the previous job's token scope
+    if session.get('file_id'):
+        get_token_store().discard(session['file_id'])
+        get_preview_engine().discard(session['file_id'])
+    session.clear()
+
+def start_analysis(file_id, filepath):
+    get_storage().create_session(file_id, filepath)
+    app.logger.info(f'File uploaded: {os.path.basename(filepath)}')
+
+    # Analyze in the background so the upload request returns right away
+    job = get_job_manager().submit('analysis', run_analysis, file_id, filepath,
+                                   profile=profile_requested())
+
+    session['file_id'] = file_id
+    session['filepath'] = filepath
+    session['analysis_job_id'] = job.id
+    session['current_step'] = 1
+    return job
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    session.clear()
+    reset_session()
     if request.method == 'POST':
         if 'file' not in request.files:
             flash('No file part')
@@ -47,29 +144,8 @@ def index():
                 file_id = str(uuid.uuid4())
                 filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_{filename}")
                 file.save(filepath)
-                app.logger.info(f'File uploaded: {filename}')
-
-                # Analyze document and suggest redactions
-                suggested_redactions = analyze_document(filepath)
-
-                # Organize suggested redactions by type for display
-                organized_redactions = {}
-                for key, value in suggested_redactions.items():
-                    ent_type = value['type']
-                    if ent_type not in organized_redactions:
-                        organized_redactions[ent_type] = []
-                    organized_redactions[ent_type].append((key, value))
-
-                # Save suggested redactions to a file
-                redactions_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_redactions.json")
-                with open(redactions_filepath, 'w') as f:
-                    json.dump(suggested_redactions, f)
-
-                session['file_id'] = file_id
-                session['filepath'] = filepath
-                session['current_step'] = 1
-
-                return redirect(url_for('review_options'))
+                job = start_analysis(file_id, filepath)
+                return redirect(url_for('analysis_status', job_id=job.id))
             except Exception as e:
                 app.logger.error(f'Error during file upload: {str(e)}')
                 flash(f"An error occurred: {str(e)}")
@@ -79,20 +155,114 @@ def index():
             return redirect(request.url)
     return render_template('index.html')
 
+# Chunked uploads for files over MAX_CONTENT_LENGTH: POST /api/uploads with
+# {"filename", "size"}, PUT each chunk to /api/uploads/<id> with a Content-Range
+# header, GET /api/uploads/<id> for the offset to resume from after a failure,
+# then POST /api/uploads/<id>/complete to start the analysis
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    payload = request.get_json(silent=True) or {}
+    filename = secure_filename(str(payload.get('filename', '')))
+    if not allowed_file(filename):
+        return jsonify({'success': False, 'error': 'Allowed file type is .docx'}), 400
+    try:
+        upload = get_upload_manager().create(filename, int(payload.get('size') or 0))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid size'}), 400
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    return jsonify({'success': True, **upload}), 201
+
+def chunk_offset():
+    # Content-Range: bytes <first>-<last>/<total>, or ?offset= for clients that cannot set it
+    content_range = parse_content_range_header(request.headers.get('Content-Range'))
+    if content_range is not None and content_range.units == 'bytes' and content_range.start is not None:
+        return content_range.start
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        raise UploadError('Content-Range header or offset parameter required')
+    return offset
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def upload_chunk(upload_id):
+    manager = get_upload_manager()
+    try:
+        if request.method == 'PUT':
+            upload = manager.append(upload_id, chunk_offset(), request.stream)
+        elif request.method == 'DELETE':
+            manager.discard(upload_id)
+            return jsonify({'success': True})
+        else:
+            upload = manager.status(upload_id)
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e), 'offset': e.offset}), e.status
+    return jsonify({'success': True, **upload})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    manager = get_upload_manager()
+    try:
+        filename = manager.status(upload_id)['filename']
+        file_id = str(uuid.uuid4())
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_{filename}")
+        # Hashed while the chunks arrived, so the analysis cache lookup does not read the file again
+        manager.complete(upload_id, filepath)
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e), 'offset': e.offset}), e.status
+    reset_session()
+    job = start_analysis(file_id, filepath)
+    return jsonify({'success': True, 'file_id': file_id, 'job_id': job.id,
+                    'redirect': url_for('analysis_status', job_id=job.id)})
+
+def run_analysis(file_id, filepath, progress=None, profile=False):
+    with tracing('analysis', file_id=file_id) as trace, profiling(f"analysis_{trace.id}", enabled=profile):
+        # Parse and index once up front; preview, search and finalize reuse the cached index
+        get_search_index(filepath)
+
+        # Analyze document and suggest redactions, then save them for review
+        suggested_redactions = analyze_document(filepath, progress=progress, token_scope=file_id)
+        trace.fields['suggestions'] = len(suggested_redactions)
+
+        get_storage().put_redactions(file_id, 'suggested', suggested_redactions)
+    app.logger.info(f'File analyzed: {os.path.basename(filepath)}')
+    return len(suggested_redactions)
+
+@app.route('/analysis/<job_id>')
+def analysis_status(job_id):
+    # Job state comes from storage when another web worker runs the analysis
+    job = get_job_manager().state(job_id)
+    if job is None or job_id != session.get('analysis_job_id'):
+        return redirect(url_for('review_options'))
+    if job['status'] == 'done':
+        return redirect(url_for('review_options'))
+    if job['status'] == 'failed':
+        app.logger.error(f"Error during analysis: {job['error']}")
+        flash(f"An error occurred: {job['error']}")
+        return redirect(url_for('index'))
+    return render_template('analysis_status.html', job=job, current_step=session.get('current_step', 1))
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    # Batch jobs run on their own manager; both publish their state to storage
+    job = get_batch_manager().state(job_id) or get_job_manager().state(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    return jsonify({'success': True, 'job': job})
+
 @app.route('/review_options', methods=['GET', 'POST'])
 def review_options():
     file_id = session.get('file_id')
     if not file_id:
         return redirect(url_for('index'))
 
-    redactions_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_redactions.json")
-    if not os.path.exists(redactions_filepath):
+    job = get_job_manager().state(session.get('analysis_job_id', ''))
+    if job is not None and job['status'] in ('queued', 'running'):
+        return redirect(url_for('analysis_status', job_id=job['id']))
+    suggested_redactions = get_storage().get_redactions(file_id, 'suggested')
+    if suggested_redactions is None:
         flash('No redactions found. Please upload a file first.')
         return redirect(url_for('index'))
 
-    with open(redactions_filepath, 'r') as f:
-        suggested_redactions = json.load(f)
-
     # Organize redactions by type for display
     organized_redactions = {}
     for key, value in suggested_redactions.items():
@@ -123,10 +293,14 @@ def review_options():
                 else:
                     app.logger.warning(f"Redaction key not found in suggestions: {original}")
 
-        # Save approved redactions to a file
-        approved_redactions_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_approved_redactions.json")
-        with open(approved_redactions_filepath, 'w') as f:
-            json.dump(approved_redactions, f)
+        # Save approved redactions, replacing any earlier review
+        get_storage().put_redactions(file_id, 'approved', approved_redactions)
+
+        # Remember approved names so later uploads find them without the model
+        gazetteer = get_gazetteer()
+        if gazetteer is not None:
+            gazetteer.add({term: info['type'] for term, info in approved_redactions.items()
+                           if info['action'] != 'IGNORE'})
 
         session['current_step'] = 2
         return redirect(url_for('preview_redactions'))
@@ -140,39 +314,68 @@ def preview_redactions():
         return redirect(url_for('index'))
 
     filepath = session.get('filepath')
-    approved_redactions_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_approved_redactions.json")
+    approved_redactions = get_storage().get_redactions(file_id, 'approved')
 
-    if not os.path.exists(approved_redactions_filepath):
+    if approved_redactions is None:
         flash('No approved redactions found. Please review redactions first.')
         return redirect(url_for('review_options'))
 
-    with open(approved_redactions_filepath, 'r') as f:
-        approved_redactions = json.load(f)
-
     if request.method == 'POST':
         # Handle additional redactions added in the preview page
-        for term, action, custom_value in zip(
+        add_redaction_terms(approved_redactions, file_id, zip(
             request.form.getlist('term[]'),
             request.form.getlist('redaction_type[]'),
             request.form.getlist('custom_replacement[]')
-        ):
-            if term.strip():
-                approved_redactions[term] = {
-                    'type': 'CUSTOM',
-                    'token': generate_token_for_term(term),
-                    'action': action,
-                    'custom_value': custom_value if action == 'CUSTOM' else ''
-                }
-
-        # Save updated approved redactions
-        with open(approved_redactions_filepath, 'w') as f:
-            json.dump(approved_redactions, f)
-
-    # Generate the preview
-    preview = get_preview(filepath, approved_redactions)
+        ))
+
+    # Only the paragraphs containing terms that changed since the last render are redone
+    preview = get_preview_engine().render(file_id, filepath, redaction_replacements(approved_redactions, file_id))
 
     return render_template('preview_redactions.html', preview=preview, approved_redactions=approved_redactions, current_step=session.get('current_step', 2))
 
+def add_redaction_terms(approved_redactions, file_id, entries):
+    added = {}
+    for term, action, custom_value in entries:
+        if term.strip():
+            added[term] = {
+                'type': 'CUSTOM',
+                'token': generate_token_for_term(term, file_id),
+                'action': action,
+                'custom_value': custom_value if action == 'CUSTOM' else ''
+            }
+    # Only the added or changed rows are written
+    if added:
+        get_storage().update_redactions(file_id, 'approved', added)
+        approved_redactions.update(added)
+
+@app.route('/api/preview', methods=['POST'])
+def preview_api():
+    # Body: {"version": <version the page shows>, "terms": [{"term", "action", "custom_value"}]}.
+    # Returns only the changed paragraphs, or the full preview when version is stale.
+    file_id = session.get('file_id')
+    if not file_id:
+        return jsonify({'success': False, 'error': 'No document loaded'}), 400
+    approved_redactions = get_storage().get_redactions(file_id, 'approved')
+    if approved_redactions is None:
+        return jsonify({'success': False, 'error': 'No approved redactions found'}), 404
+
+    payload = request.get_json(silent=True) or {}
+    add_redaction_terms(approved_redactions, file_id, (
+        (str(entry.get('term', '')), entry.get('action', 'REDACTED'), entry.get('custom_value', ''))
+        for entry in payload.get('terms') or [] if isinstance(entry, dict)
+    ))
+
+    preview = get_preview_engine().render(
+        file_id, session.get('filepath'), redaction_replacements(approved_redactions, file_id),
+        since=payload.get('version'),
+    )
+    return jsonify({'success': True, **preview})
+
+def send_document(path, download_name):
+    # Streamed from disk in blocks; conditional=True adds ETag and Range support so
+    # an interrupted download of a large document can resume
+    return send_file(path, as_attachment=True, download_name=download_name, conditional=True)
+
 # Add the reverse_redaction route here
 @app.route('/reverse_redaction', methods=['POST'])
 def reverse_redaction():
@@ -181,20 +384,18 @@ def reverse_redaction():
         flash('No file to restore')
         return redirect(url_for('index'))
 
-    redacted_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_redacted.docx")
-    redaction_map_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_redaction_map.json")
+    redaction_id = session.get('redaction_id', '')
+    redacted_filepath = redacted_path(session.get('filepath', ''), redaction_id)
+    redaction_map = get_storage().get_redaction_map(redaction_id) if redaction_id else None
 
-    if not os.path.exists(redacted_filepath) or not os.path.exists(redaction_map_filepath):
+    if redaction_map is None or not os.path.exists(redacted_filepath):
         flash('Redacted file or redaction map not found')
         return redirect(url_for('index'))
 
     try:
-        with open(redaction_map_filepath, 'r') as f:
-            redaction_map = json.load(f)
-
         restored_filepath = restore_document(redacted_filepath, redaction_map)
         app.logger.info(f'File restored: {file_id}')
-        return send_file(restored_filepath, as_attachment=True, download_name="restored_document.docx")
+        return send_document(restored_filepath, "restored_document.docx")
     except Exception as e:
         app.logger.error(f'Error during restoration: {str(e)}')
         flash(f"An error occurred during restoration: {str(e)}")
@@ -208,25 +409,21 @@ def finalize_redactions():
         return redirect(url_for('index'))
 
     filepath = session.get('filepath')
-    approved_redactions_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}_approved_redactions.json")
+    approved_redactions = get_storage().get_redactions(file_id, 'approved')
 
-    if not os.path.exists(approved_redactions_filepath):
+    if approved_redactions is None:
         flash('No approved redactions found. Please review redactions first.')
         return redirect(url_for('review_options'))
 
-    with open(approved_redactions_filepath, 'r') as f:
-        approved_redactions = json.load(f)
-
     # Generate a unique Redaction ID
     redaction_id = str(uuid.uuid4())
     session['redaction_id'] = redaction_id
 
-    redacted_filepath, redaction_map = redact_document(filepath, approved_redactions, redaction_id)
+    redacted_filepath, redaction_map = redact_document(filepath, approved_redactions, redaction_id,
+                                                       token_scope=file_id)
 
-    # Save redaction_map to a file
-    redaction_map_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{redaction_id}_redaction_map.json")
-    with open(redaction_map_filepath, 'w') as f:
-        json.dump(redaction_map, f)
+    # Keep the redaction map for restores
+    get_storage().put_redaction_map(redaction_id, file_id, redaction_map)
 
     app.logger.info(f'File redacted: {os.path.basename(filepath)}')
 
@@ -239,7 +436,17 @@ def finalize_redactions():
     flash(f"Your Redaction ID is: {redaction_id}. Please keep it safe for restoring the original document.")
 
     # Return the redacted file for download
-    return send_file(redacted_filepath, as_attachment=True, download_name="redacted_document.docx")
+    return send_document(redacted_filepath, "redacted_document.docx")
+
+@app.route('/download/redacted')
+def download_redacted():
+    # GET form of the finalize download, so clients can resume it with Range requests
+    redaction_id = session.get('redaction_id')
+    redacted_filepath = redacted_path(session.get('filepath', ''), redaction_id)
+    if not redaction_id or not os.path.exists(redacted_filepath):
+        flash('Redacted file not found')
+        return redirect(url_for('index'))
+    return send_document(redacted_filepath, "redacted_document.docx")
 
 @app.route('/redaction_summary')
 def redaction_summary():
@@ -266,18 +473,15 @@ def restore():
                 redacted_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"restored_{filename}")
                 file.save(redacted_filepath)
 
-                redaction_map_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{redaction_id}_redaction_map.json")
-                if not os.path.exists(redaction_map_filepath):
+                redaction_map = get_storage().get_redaction_map(redaction_id)
+                if redaction_map is None:
                     flash('Invalid Redaction ID or redaction map not found.')
                     return redirect(request.url)
 
-                with open(redaction_map_filepath, 'r') as f:
-                    redaction_map = json.load(f)
-
                 restored_filepath = restore_document(redacted_filepath, redaction_map)
                 app.logger.info(f'File restored using Redaction ID: {redaction_id}')
 
-                return send_file(restored_filepath, as_attachment=True, download_name="restored_document.docx")
+                return send_document(restored_filepath, "restored_document.docx")
             except Exception as e:
                 app.logger.error(f'Error during restoration: {str(e)}')
                 flash(f"An error occurred: {str(e)}")
@@ -297,8 +501,46 @@ def search():
     if not query:
         return jsonify({'success': False, 'error': 'No search query provided'})
 
-    results = search_document(filepath, query)
-    return jsonify({'success': True, 'results': results})
+    page = request.form.get('page', 1, type=int)
+    per_page = request.form.get('per_page', type=int)
+    whole_word = request.form.get('whole_word') in ('1', 'true', 'on')
+    found = search_document(filepath, query, page=page, per_page=per_page, whole_word=whole_word)
+    return jsonify({'success': True, **found})
+
+@app.route('/health/nlp')
+def nlp_health():
+    health = get_pool().health()
+    return jsonify(health), (200 if health['ready'] else 503)
+
+@app.route('/api/batch', methods=['POST'])
+def batch_redact():
+    payload = request.get_json(silent=True) or {}
+    root = os.path.realpath(app.config['BATCH_ROOT'])
+    paths = {}
+    for field in ('input', 'output'):
+        if not payload.get(field):
+            return jsonify({'success': False, 'error': f'Missing {field}'}), 400
+        # Batch paths are resolved under BATCH_ROOT and may not escape it
+        path = os.path.realpath(os.path.join(root, payload[field]))
+        if os.path.commonpath([root, path]) != root:
+            return jsonify({'success': False, 'error': f'{field} must be inside the batch root'}), 400
+        paths[field] = path
+    if not os.path.exists(paths['input']):
+        return jsonify({'success': False, 'error': 'Input not found'}), 404
+    # Only inline policies: load_policy would open a string as a file on the server
+    policy = payload.get('policy')
+    if policy is not None and not isinstance(policy, dict):
+        return jsonify({'success': False, 'error': 'policy must be an object'}), 400
+    workers = payload.get('workers')
+    if workers is not None:
+        if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+            return jsonify({'success': False, 'error': 'workers must be a positive integer'}), 400
+        workers = min(workers, app.config['BATCH_WORKERS'])
+
+    job = get_batch_manager().submit('batch', run_batch, paths['input'], paths['output'],
+                                     policy=policy, workers=workers, root=root)
+    app.logger.info(f'Batch queued: {payload["input"]} -> {payload["output"]}')
+    return jsonify({'success': True, 'job_id': job.id, 'status_url': url_for('job_status', job_id=job.id)}), 202
 
 def generate_summary(redaction_map):
     summary = {
@@ -0,0 +1,234 @@
+"""Headless batch redaction for folders or manifests of .docx files.
+
+Usage:
+    python batch.py INPUT OUTPUT_DIR [--policy policy.json] [--workers N]
+
+INPUT is a directory (searched recursively) or a manifest file listing one
+.docx path per line. The policy is a JSON object such as:
+
+    {
+        "actions": {"PERSON": "REDACT", "ORG": "REDACT", "EMAIL": "MASK"},
+        "default_action": "IGNORE",
+        "patterns": [{"label": "EMPLOYEE_ID", "pattern": "\\\\bEMP-\\\\d{6}\\\\b"}]
+    }
+
+Each file produces <name>_redacted.docx and <name>_redaction_map.json in the
+output directory. Progress is appended to batch_state.jsonl there, so a run
+that crashed can be restarted with the same arguments and skips files that
+already finished.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from analysis_cache import file_digest
+from config import Config
+
+STATE_FILENAME = 'batch_state.jsonl'
+SUMMARY_FILENAME = 'batch_summary.json'
+
+DEFAULT_POLICY = {
+    'actions': {},
+    'default_action': 'REDACT',
+    'patterns': [],
+}
+
+
+def load_policy(policy):
+    # Accepts a path to a JSON file, a dict, or None for the default policy
+    if policy is None:
+        return dict(DEFAULT_POLICY)
+    if isinstance(policy, str):
+        with open(policy, 'r') as f:
+            policy = json.load(f)
+    merged = dict(DEFAULT_POLICY)
+    merged.update(policy)
+    return merged
+
+
+def collect_inputs(source, root=None):
+    # With root (API requests), every input must resolve to a .docx inside it:
+    # manifest lines may be absolute or climb out with ../, and walked files
+    # may be symlinks
+    if os.path.isdir(source):
+        paths = []
+        for dirpath, _, files in os.walk(source):
+            for name in files:
+                # Skip Word lock files such as ~$report.docx
+                if name.lower().endswith('.docx') and not name.startswith('~$'):
+                    paths.append(os.path.join(dirpath, name))
+        paths = sorted(paths)
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, 'r') as f:
+            lines = [line.strip() for line in f]
+        paths = [line if os.path.isabs(line) else os.path.join(base, line)
+                 for line in lines if line and not line.startswith('#')]
+    if root is not None:
+        root = os.path.realpath(root)
+        for path in paths:
+            resolved = os.path.realpath(path)
+            if os.path.commonpath([root, resolved]) != root or not resolved.lower().endswith('.docx'):
+                raise ValueError(f'Input must be a .docx file inside the batch root: {path}')
+    return paths
+
+
+def output_name(source, path):
+    # Flatten the path relative to the input directory so names stay unique
+    root = source if os.path.isdir(source) else os.path.dirname(os.path.abspath(source))
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+    if relative.startswith('..'):
+        relative = os.path.basename(path)
+    return os.path.splitext(relative)[0].replace(os.sep, '__')
+
+
+def load_state(output_dir):
+    done = {}
+    state_path = os.path.join(output_dir, STATE_FILENAME)
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Partially written line from a crash
+                if entry.get('status') == 'done':
+                    done[entry['path']] = entry.get('digest')
+    return done
+
+
+def approve(suggestions, policy):
+    approved = {}
+    for term, info in suggestions.items():
+        action = policy['actions'].get(info['type'], policy['default_action'])
+        if action != 'IGNORE':
+            approved[term] = dict(info, action=action)
+    return approved
+
+
+def redact_file(path, name, output_dir, policy):
+    from redactor import analyze_document, redact_document
+    from token_store import get_token_store
+
+    started = time.time()
+    redaction_id = str(uuid.uuid4())
+    suggestions = analyze_document(path, extra_patterns=policy['patterns'], token_scope=redaction_id)
+    approved = approve(suggestions, policy)
+    redacted_path = os.path.join(output_dir, f"{name}_redacted.docx")
+    _, redaction_map = redact_document(path, approved, redaction_id, output_path=redacted_path,
+                                       token_scope=redaction_id)
+    get_token_store().discard(redaction_id)
+    with open(os.path.join(output_dir, f"{name}_redaction_map.json"), 'w') as f:
+        json.dump({'redaction_id': redaction_id, 'source': path, 'redaction_map': redaction_map}, f)
+    return {
+        'redaction_id': redaction_id,
+        'output': redacted_path,
+        'redactions': len(redaction_map),
+        'seconds': time.time() - started,
+    }
+
+
+def _init_worker():
+    # Each batch worker is already its own process; load the model inline in it.
+    # Drop pool and cache handles inherited from a forking parent (e.g. the web app).
+    # Parallelism comes from the batch workers, so parts are not farmed out again.
+    import analysis_cache
+    import gazetteer
+    import nlp_pool
+    Config.NLP_POOL_WORKERS = 0
+    Config.REDACT_PART_WORKERS = 0
+    nlp_pool._pool = None
+    analysis_cache._cache = None
+    gazetteer._gazetteer = None
+
+
+def _process(path, name, output_dir, policy):
+    try:
+        return dict(redact_file(path, name, output_dir, policy), status='done')
+    except Exception as e:
+        return {'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+
+
+def run_batch(source, output_dir, policy=None, workers=None, progress=None, log=None, root=None):
+    policy = load_policy(policy)
+    workers = workers or Config.BATCH_WORKERS
+    paths = collect_inputs(source, root)
+    os.makedirs(output_dir, exist_ok=True)
+
+    finished = load_state(output_dir)
+    pending = []
+    skipped = 0
+    for path in paths:
+        digest = file_digest(path) if os.path.exists(path) else None
+        if path in finished and finished[path] == digest:
+            skipped += 1
+        else:
+            pending.append((path, digest))
+
+    totals = {'files': len(paths), 'skipped': skipped, 'done': 0, 'failed': 0, 'bytes': 0}
+    started = time.time()
+    if progress:
+        progress(skipped, len(paths))
+
+    state_path = os.path.join(output_dir, STATE_FILENAME)
+    with open(state_path, 'a') as state, ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {
+            pool.submit(_process, path, output_name(source, path), output_dir, policy): (path, digest)
+            for path, digest in pending
+        }
+        for future in as_completed(futures):
+            path, digest = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # A worker died (e.g. out of memory); record it and let a rerun retry the file
+                result = {'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+            entry = dict(result, path=path, digest=digest, finished=time.time())
+            state.write(json.dumps(entry) + '\n')
+            state.flush()
+            os.fsync(state.fileno())
+
+            totals[result['status']] += 1
+            if result['status'] == 'done':
+                totals['bytes'] += os.path.getsize(path)
+            if log:
+                log(entry)
+            if progress:
+                progress(skipped + totals['done'] + totals['failed'], len(paths))
+
+    elapsed = time.time() - started
+    totals['seconds'] = elapsed
+    totals['files_per_second'] = totals['done'] / elapsed if elapsed else 0.0
+    totals['megabytes_per_second'] = totals['bytes'] / (1024 * 1024) / elapsed if elapsed else 0.0
+    with open(os.path.join(output_dir, SUMMARY_FILENAME), 'w') as f:
+        json.dump(totals, f, indent=2)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Redact a folder or manifest of .docx files.')
+    parser.add_argument('input', help='Directory of .docx files or a manifest with one path per line')
+    parser.add_argument('output', help='Directory for redacted files, redaction maps and batch state')
+    parser.add_argument('--policy', help='JSON policy file (entity actions and custom patterns)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: BATCH_WORKERS)')
+    args = parser.parse_args(argv)
+
+    def log(entry):
+        if entry['status'] == 'done':
+            print(f"done    {entry['path']} ({entry['redactions']} redactions, {entry['seconds']:.1f}s)")
+        else:
+            print(f"FAILED  {entry['path']}: {entry['error']}", file=sys.stderr)
+
+    totals = run_batch(args.input, args.output, policy=args.policy, workers=args.workers, log=log)
+    print(f"{totals['done']} redacted, {totals['failed']} failed, {totals['skipped']} skipped "
+          f"in {totals['seconds']:.1f}s ({totals['files_per_second']:.2f} files/s, "
+          f"{totals['megabytes_per_second']:.2f} MB/s)")
+    return 1 if totals['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
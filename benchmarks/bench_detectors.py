@@ -0,0 +1,76 @@
+"""Scan cost of the combined detector registry versus one re.finditer pass per detector.
+
+Usage: python benchmarks/bench_detectors.py [--detectors 2 8 32 128] [--chars 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from detectors import DetectorRegistry
+
+
+def make_definitions(count):
+    # The configured detectors first, then synthetic ID formats to grow the set
+    definitions = list(Config.DETECTORS)[:count]
+    i = 0
+    while len(definitions) < count:
+        definitions.append({'label': f'ID_{i}', 'pattern': rf'\bK{i:03d}-\d{{4}}-[A-Z]{{2}}\b'})
+        i += 1
+    return definitions
+
+
+def make_text(chars, rng):
+    samples = ['123-45-6789', 'jane.doe@example.com', '4111 1111 1111 1111', '(555) 123-4567',
+               '10.0.0.12', 'K007-1234-AB', 'GB82 WEST 1234 5698 7654 32']
+    words = ['the', 'supplier', 'will', 'provide', 'monthly', 'reports', 'on', 'service', 'levels']
+    parts = []
+    size = 0
+    while size < chars:
+        word = rng.choice(samples) if rng.random() < 0.02 else rng.choice(words)
+        parts.append(word)
+        size += len(word) + 1
+    return ' '.join(parts)
+
+
+def per_pattern(text, registry):
+    found = 0
+    for detector in registry.detectors:
+        for match in detector.regex.finditer(text):
+            if detector.accepts(match.group()):
+                found += 1
+    return found
+
+
+def combined(text, registry):
+    return sum(1 for _ in registry.finditer(text))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--detectors', type=int, nargs='+', default=[2, 8, 32, 128])
+    parser.add_argument('--chars', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    text = make_text(args.chars, random.Random(args.seed))
+    print(f"{'detectors':>9} {'per-pattern s':>14} {'combined s':>11} {'speedup':>8}")
+    for count in args.detectors:
+        registry = DetectorRegistry.from_config(make_definitions(count))
+        separate = timed(per_pattern, text, registry)
+        single = timed(combined, text, registry)
+        print(f"{count:>9} {separate:>14.3f} {single:>11.3f} {separate / single:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
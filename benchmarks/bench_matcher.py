@@ -0,0 +1,81 @@
+"""Compare the single-pass TermMatcher against the per-term str.replace loop.
+
+Usage: python benchmarks/bench_matcher.py [--terms 10 100 1000 2000] [--paragraphs 500 5000]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matcher import TermMatcher
+
+
+def make_terms(count, rng):
+    terms = set()
+    while len(terms) < count:
+        words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))).capitalize()
+                 for _ in range(rng.randint(1, 3))]
+        terms.add(' '.join(words))
+    return sorted(terms)
+
+
+def make_paragraphs(count, terms, rng, hit_rate=0.3):
+    filler = ['the', 'contractor', 'shall', 'deliver', 'services', 'under', 'this', 'agreement',
+              'including', 'all', 'reports', 'and', 'schedules', 'as', 'required', 'by']
+    paragraphs = []
+    for _ in range(count):
+        words = rng.choices(filler, k=rng.randint(30, 80))
+        if terms and rng.random() < hit_rate:
+            for _ in range(rng.randint(1, 3)):
+                words.insert(rng.randrange(len(words)), rng.choice(terms))
+        paragraphs.append(' '.join(words))
+    return paragraphs
+
+
+def naive(paragraphs, replacements):
+    out = []
+    for text in paragraphs:
+        for original, replacement in replacements.items():
+            if original in text:
+                text = text.replace(original, replacement)
+        out.append(text)
+    return out
+
+
+def single_pass(paragraphs, replacements):
+    matcher = TermMatcher(replacements)
+    return [matcher.sub(text)[0] for text in paragraphs]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--terms', type=int, nargs='+', default=[10, 100, 500, 2000])
+    parser.add_argument('--paragraphs', type=int, nargs='+', default=[500, 5000])
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'paragraphs':>10} {'terms':>6} {'naive s':>10} {'matcher s':>10} {'speedup':>8}")
+    for paragraph_count in args.paragraphs:
+        for term_count in args.terms:
+            terms = make_terms(term_count, rng)
+            paragraphs = make_paragraphs(paragraph_count, terms, rng)
+            replacements = {term: f"[[REDACTED_{i:08x}]]" for i, term in enumerate(terms)}
+            naive_time = timed(naive, paragraphs, replacements)
+            matcher_time = timed(single_pass, paragraphs, replacements)
+            print(f"{paragraph_count:>10} {term_count:>6} {naive_time:>10.3f} {matcher_time:>10.3f} "
+                  f"{naive_time / matcher_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
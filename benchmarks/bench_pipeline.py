@@ -0,0 +1,229 @@
+"""Time each stage of the redaction pipeline on synthetic documents and save the results as JSON.
+
+Usage: python benchmarks/bench_pipeline.py [--paragraphs 200 2000] [--stub-ner] [--approved 50]
+                                           [--repeat 3] [--output results.json]
+
+Stages are timed separately on each generated document:
+  analyze   analyze_document from a cold document index (parse, NER, detectors)
+  preview   get_preview with the approved terms
+  search    search_document, averaged over --queries queries
+  redact    redact_document to a new file
+  restore   restore_document of that redacted file
+The analysis cache is disabled so every run does the full work. Each stage
+reports the best of --repeat runs, throughput in paragraphs and source MB per
+second, and the peak Python allocation measured by tracemalloc in one extra
+run. Use --stub-ner to run offline without a spaCy model.
+
+The gazetteer is off unless --gazetteer assist|first is given; it is then
+seeded with --known (a fraction) of each document's entities, and analyze
+also reports the share of characters kept from NER.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+
+Config.ANALYSIS_CACHE_ENABLED = False
+Config.NLP_POOL_WORKERS = 0
+Config.GAZETTEER_MODE = 'off'
+
+from corpus import add_corpus_arguments, corpus_options, generate_docx
+from document_cache import get_document_cache, index_path
+from gazetteer import GAZETTEER_CHARACTERS, get_gazetteer
+from redactor import analyze_document, get_preview, redact_document, restore_document, search_document
+
+TOKEN_SCOPE = 'bench'
+
+
+def approved_terms(entity_kinds, count, rng):
+    # Mostly redactions, some masks and custom values, like a reviewed document
+    terms = sorted(entity_kinds)
+    rng.shuffle(terms)
+    approved = {}
+    for term in terms[:count]:
+        action = rng.choices(['REDACT', 'MASK', 'CUSTOM'], weights=[8, 1, 1])[0]
+        approved[term] = {'type': entity_kinds[term], 'action': action, 'custom_value': f'<{entity_kinds[term]}>'}
+    return approved
+
+
+def cold_index(path):
+    get_document_cache().discard(path)
+    saved = index_path(path)
+    if saved and os.path.exists(saved):
+        os.remove(saved)
+
+
+def measure(func, repeat, setup=None):
+    # Best wall time of repeat runs, then one traced run for the allocation peak
+    best = None
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def bench_document(path, paragraph_count, entity_kinds, args, rng):
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    approved = approved_terms(entity_kinds, args.approved, rng)
+    queries = rng.sample(sorted(entity_kinds), min(args.queries, len(entity_kinds))) or ['proposal']
+    workdir = os.path.dirname(path)
+    redacted_path = os.path.join(workdir, 'bench_redacted.docx')
+
+    stages = {}
+
+    def record(stage, seconds, peak, operations=1):
+        stages[stage] = {
+            'seconds': round(seconds / operations, 6),
+            'paragraphs_per_second': round(paragraph_count * operations / seconds, 1) if seconds else None,
+            'mb_per_second': round(size_mb * operations / seconds, 3) if seconds else None,
+            'peak_alloc_mb': round(peak / (1024 * 1024), 3),
+        }
+
+    gazetteer = get_gazetteer()
+    if gazetteer is not None:
+        gazetteer.clear()
+        terms = sorted(entity_kinds)
+        gazetteer.add({term: entity_kinds[term] for term in rng.sample(terms, int(len(terms) * args.known))})
+    skipped = GAZETTEER_CHARACTERS.value(result='covered', ner='skipped')
+    analyzed = sum(GAZETTEER_CHARACTERS.value(result=result, ner=ner)
+                   for result in ('covered', 'partial', 'miss') for ner in ('sent', 'skipped'))
+
+    seconds, peak, suggestions = measure(
+        lambda: analyze_document(path, token_scope=TOKEN_SCOPE), args.repeat, setup=lambda: cold_index(path))
+    record('analyze', seconds, peak)
+    stages['analyze']['suggestions'] = len(suggestions)
+    if gazetteer is not None:
+        skipped = GAZETTEER_CHARACTERS.value(result='covered', ner='skipped') - skipped
+        analyzed = sum(GAZETTEER_CHARACTERS.value(result=result, ner=ner)
+                       for result in ('covered', 'partial', 'miss') for ner in ('sent', 'skipped')) - analyzed
+        stages['analyze']['ner_skipped_share'] = round(skipped / analyzed, 3) if analyzed else 0.0
+
+    seconds, peak, _ = measure(lambda: get_preview(path, approved, token_scope=TOKEN_SCOPE), args.repeat)
+    record('preview', seconds, peak)
+
+    def search_all():
+        return sum(search_document(path, query)['total'] for query in queries)
+
+    seconds, peak, hits = measure(search_all, args.repeat)
+    record('search', seconds, peak, operations=len(queries))
+    stages['search'].update({'queries': len(queries), 'hits': hits})
+
+    seconds, peak, (_, redaction_map) = measure(
+        lambda: redact_document(path, approved, 'bench', output_path=redacted_path, token_scope=TOKEN_SCOPE),
+        args.repeat)
+    record('redact', seconds, peak)
+    stages['redact']['tokens'] = len(redaction_map)
+
+    seconds, peak, restored_path = measure(lambda: restore_document(redacted_path, redaction_map), args.repeat)
+    record('restore', seconds, peak)
+    for produced in (redacted_path, restored_path):
+        if os.path.exists(produced):
+            os.remove(produced)
+
+    return {'paragraphs': paragraph_count, 'bytes': os.path.getsize(path), 'approved': len(approved),
+            'stages': stages}
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_corpus_arguments(parser)
+    parser.set_defaults(paragraphs=[200, 2000])
+    parser.add_argument('--approved', type=int, default=50, help='Approved terms per document')
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stub-ner', action='store_true', help='Use the regex stand-in instead of spaCy')
+    parser.add_argument('--gazetteer', choices=['off', 'assist', 'first'], default='off')
+    parser.add_argument('--known', type=float, default=0.8,
+                        help='Fraction of each document\'s entities seeded into the gazetteer')
+    parser.add_argument('--workdir', help='Where to write the generated documents (default: a temp dir)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.stub_ner:
+        import stub_ner
+        stub_ner.install()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='redaction_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    Config.GAZETTEER_MODE = args.gazetteer
+    Config.GAZETTEER_PATH = os.path.join(workdir, 'gazetteer.sqlite3')
+    Config.UPLOAD_FOLDER = workdir  # Index files are only kept for uploads, as in the web flow
+    rng = random.Random(args.seed)
+    results = []
+    print(f"{'paragraphs':>10} {'stage':>8} {'seconds':>10} {'para/s':>10} {'MB/s':>8} {'peak MB':>8}")
+    for paragraph_count in args.paragraphs:
+        path = os.path.join(workdir, f'synthetic_{paragraph_count}p.docx')
+        entity_kinds = generate_docx(path, paragraphs=paragraph_count, seed=args.seed, **corpus_options(args))
+        result = bench_document(path, paragraph_count, entity_kinds, args, rng)
+        results.append(result)
+        for stage, numbers in result['stages'].items():
+            print(f"{paragraph_count:>10} {stage:>8} {numbers['seconds']:>10.4f} "
+                  f"{numbers['paragraphs_per_second'] or 0:>10.0f} {numbers['mb_per_second'] or 0:>8.2f} "
+                  f"{numbers['peak_alloc_mb']:>8.2f}")
+
+    report = {
+        'timestamp': time.time(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'ner': 'stub' if args.stub_ner else Config.NLP_MODEL,
+        'options': {**corpus_options(args), 'approved': args.approved, 'queries': args.queries,
+                    'repeat': args.repeat, 'seed': args.seed, 'gazetteer': args.gazetteer,
+                    'known': args.known},
+        'max_rss_mb': max_rss_mb(),
+        'documents': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""Compare NER tiers on a labeled sample: throughput, escalation share, recall and precision.
+
+Usage: python benchmarks/bench_tiers.py [--manifest manifest.json | --paragraphs 500 ...]
+                                        [--tiers single tiered:rules tiered:en_core_web_sm fast:en_core_web_sm]
+                                        [--stub-ner] [--repeat 3] [--output report.json]
+
+Tiers:
+  single          every paragraph goes to the main model (NLP_MODEL)
+  tiered:<fast>   <fast> reads every paragraph; the ones it escalates go to the main model
+  fast:<fast>     <fast> alone with nothing escalated, the floor for tiered:<fast>
+<fast> is a spaCy pipeline name or 'rules'; with --stub-ner, 'stub' uses the
+regex stand-in (see stub_ner.py) and is also the main model.
+
+The labeled sample is a manifest written by corpus.py, whose entities are
+the labels, or documents generated on the fly with the corpus options. An
+entity counts toward recall when its kind is in NER_LABELS and it occurs in
+the document text; 'typed' recall also requires the right label. The
+analysis cache and the gazetteer are off so every tier does all of its work.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+
+Config.ANALYSIS_CACHE_ENABLED = False
+Config.NLP_POOL_WORKERS = 0
+Config.GAZETTEER_MODE = 'off'
+
+import nlp_pool
+import tiers
+from corpus import add_corpus_arguments, corpus_options, generate_docx
+from document_cache import get_document_index
+from redactor import suggest_redactions
+
+ESCALATION = ('NER_ESCALATE_DENSITY', 'NER_ESCALATE_LABELS', 'NER_ESCALATE_UNTAGGED')
+
+
+def configure(spec, stub):
+    # Applies one --tiers entry to Config; returns the settings to restore afterwards
+    saved = {name: getattr(Config, name) for name in ('NER_TIERS', 'NLP_FAST_MODEL') + ESCALATION}
+    mode, _, fast = spec.partition(':')
+    if mode == 'single':
+        Config.NER_TIERS = 'single'
+        return saved
+    if mode not in ('tiered', 'fast') or not fast or (mode == 'fast' and fast == tiers.RULES):
+        raise SystemExit(f'Unknown tier: {spec}')  # The rules tier finds no entities of its own
+    Config.NER_TIERS = 'tiered'
+    Config.NLP_FAST_MODEL = fast
+    if fast == 'stub':
+        if stub is None:
+            raise SystemExit('The stub tier needs --stub-ner')
+        nlp_pool._fast_models['stub'] = stub  # Fast pipelines are looked up by name
+    if mode == 'fast':
+        # Nothing is escalated, so only the fast tier's own entities are reported
+        Config.NER_ESCALATE_DENSITY = float('inf')
+        Config.NER_ESCALATE_LABELS = []
+        Config.NER_ESCALATE_UNTAGGED = False
+    return saved
+
+
+def load_sample(args, workdir):
+    if args.manifest:
+        with open(args.manifest) as f:
+            return [(entry['path'], entry['entities']) for entry in json.load(f)]
+    sample = []
+    for n, paragraph_count in enumerate(args.paragraphs):
+        path = os.path.join(workdir, f'labeled_{paragraph_count}p_{n}.docx')
+        sample.append((path, generate_docx(path, paragraphs=paragraph_count, seed=args.seed + n,
+                                           **corpus_options(args))))
+    return sample
+
+
+def score(suggestions, gold):
+    found = {term: info['type'] for term, info in suggestions.items() if info['type'] in Config.NER_LABELS}
+    hits = [term for term in gold if term in found]
+    per_label = {}
+    for term, kind in gold.items():
+        counts = per_label.setdefault(kind, [0, 0])
+        counts[0] += term in found
+        counts[1] += 1
+    return {
+        'gold': len(gold),
+        'found': len(found),
+        'hits': len(hits),
+        'typed_hits': sum(found[term] == gold[term] for term in hits),
+        'correct': sum(term in gold for term in found),
+        'per_label': per_label,
+    }
+
+
+def ratio(numerator, denominator):
+    return round(numerator / denominator, 3) if denominator else None
+
+
+def main_characters():
+    return tiers.TIER_CHARACTERS.value(tier='main')
+
+
+def all_characters():
+    return sum(tiers.TIER_CHARACTERS.value(tier=tier) for tier in ('main', 'fast', tiers.RULES))
+
+
+def bench_tier(spec, texts, args, stub):
+    saved = configure(spec, stub)
+    tiered = Config.NER_TIERS == 'tiered'
+    try:
+        seconds = 0.0
+        totals = {'gold': 0, 'found': 0, 'hits': 0, 'typed_hits': 0, 'correct': 0}
+        per_label = {}
+        escalated = characters = 0
+        for text, gold in texts:
+            best = None
+            for _ in range(args.repeat):
+                sent, seen = main_characters(), all_characters()
+                started = time.perf_counter()
+                suggestions = suggest_redactions(text)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            seconds += best
+            if tiered:
+                escalated += main_characters() - sent
+                characters += all_characters() - seen
+            result = score(suggestions, gold)
+            for key in totals:
+                totals[key] += result[key]
+            for kind, (hit, count) in result['per_label'].items():
+                counts = per_label.setdefault(kind, [0, 0])
+                counts[0] += hit
+                counts[1] += count
+    finally:
+        for name, value in saved.items():
+            setattr(Config, name, value)
+    paragraphs = sum(text.count('\n') + 1 for text, _ in texts)
+    return {
+        'tier': spec,
+        'seconds': round(seconds, 4),
+        'paragraphs_per_second': round(paragraphs / seconds, 1) if seconds else None,
+        'escalated_share': ratio(escalated, characters) if tiered else 1.0,
+        'recall': ratio(totals['hits'], totals['gold']),
+        'typed_recall': ratio(totals['typed_hits'], totals['gold']),
+        'precision': ratio(totals['correct'], totals['found']),
+        'recall_by_label': {kind: ratio(hit, count) for kind, (hit, count) in sorted(per_label.items())},
+        **totals,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_corpus_arguments(parser)
+    parser.add_argument('--manifest', help='manifest.json from corpus.py to use as the labeled sample')
+    parser.add_argument('--tiers', nargs='+', default=['single', 'tiered:rules', 'tiered:en_core_web_sm',
+                                                       'fast:en_core_web_sm'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stub-ner', action='store_true', help='Use the regex stand-in as the main model')
+    parser.add_argument('--workdir', help='Where to write generated documents (default: a temp dir)')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub_ner:
+        import stub_ner
+        stub = stub_ner.install()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='redaction_tiers_')
+    os.makedirs(workdir, exist_ok=True)
+    texts = []
+    for path, entities in load_sample(args, workdir):
+        text = '\n'.join(get_document_index(path).body_texts())
+        gold = {term: kind for term, kind in entities.items() if kind in Config.NER_LABELS and term in text}
+        texts.append((text, gold))
+
+    results = []
+    print(f"{'tier':>28} {'seconds':>9} {'para/s':>9} {'escalated':>9} {'recall':>7} {'typed':>7} {'precision':>9}")
+    for spec in args.tiers:
+        result = bench_tier(spec, texts, args, stub)
+        results.append(result)
+        print(f"{spec:>28} {result['seconds']:>9.3f} {result['paragraphs_per_second'] or 0:>9.0f} "
+              f"{result['escalated_share'] or 0:>9.2f} {result['recall'] or 0:>7.3f} "
+              f"{result['typed_recall'] or 0:>7.3f} {result['precision'] or 0:>9.3f}")
+
+    report = {
+        'timestamp': time.time(),
+        'main_model': 'stub' if args.stub_ner else Config.NLP_MODEL,
+        'documents': len(texts),
+        'paragraphs': sum(text.count('\n') + 1 for text, _ in texts),
+        'labels': Config.NER_LABELS,
+        'escalation': {name: getattr(Config, name) for name in ESCALATION},
+        'tiers': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f'Report written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
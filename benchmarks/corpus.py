@@ -0,0 +1,214 @@
+"""Generate synthetic .docx files shaped like the spoofed RFP and tender briefs in uploads/.
+
+Usage: python benchmarks/corpus.py OUTPUT_DIR [--paragraphs 500] [--count 1] [--table-every 15] ...
+
+Documents are written straight as WordprocessingML (no python-docx needed):
+headed sections of boilerplate RFP prose, requirement tables, a header and a
+footer, with people, organisations, e-mail addresses, phone numbers and other
+identifiers sprinkled in at the requested density. Paragraph text is split
+over several runs, as Word does for formatting changes.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import zipfile
+from xml.sax.saxutils import escape
+
+FIRST_NAMES = ['Jane', 'Omar', 'Priya', 'Lukas', 'Maria', 'Chen', 'Aisha', 'Tom', 'Sofia', 'Kwame']
+LAST_NAMES = ['Doe', 'Haddad', 'Raman', 'Becker', 'Alvarez', 'Wei', 'Okafor', 'Nguyen', 'Rossi', 'Mensah']
+ORG_STEMS = ['Bark', 'Cat', 'Blue', 'North', 'Summit', 'Harbor', 'Vertex', 'Pine', 'Atlas', 'Crescent']
+ORG_SUFFIXES = ['Co', 'Barn', 'Holdings', 'Systems', 'Partners', 'Logistics', 'Bank', 'Group']
+AGENCIES = ['Department of Commerce', 'Department of Defense', 'Ministry of Finance', 'City Procurement Office']
+PLACES = ['Stuttgart', 'Okinawa', 'Naples', 'Rota', 'Seoul', 'Bahrain', 'Guam', 'Kaiserslautern']
+
+SECTIONS = ['Introduction', 'Background', 'Purpose and Goals', 'Scope of Work', 'Service Detail',
+            'Training Context', 'Target Audience', 'Deliverables', 'Timeline', 'Evaluation Criteria',
+            'Pricing', 'Submission Instructions', 'Terms and Conditions']
+FILLER = ('the contractor shall deliver all services described in this request for proposal including '
+          'reports schedules and supporting documentation as required by the contracting officer within '
+          'the period of performance and in accordance with applicable policies standards and regulations '
+          'proposals must address technical approach management plan past performance and cost').split()
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/header1.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.header+xml"/>'
+    '<Override PartName="/word/footer1.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.footer+xml"/>'
+    '</Types>'
+)
+PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '</Relationships>'
+)
+DOCUMENT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/header" Target="header1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/footer" Target="footer1.xml"/>'
+    '</Relationships>'
+)
+W_NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" ' \
+       'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+
+
+def make_entities(count, rng):
+    """Distinct sensitive strings of mixed kinds, as {text: kind}."""
+    makers = [
+        ('PERSON', lambda: f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'),
+        ('ORG', lambda: f'{rng.choice(ORG_STEMS)} {rng.choice(ORG_SUFFIXES)}'),
+        ('ORG', lambda: rng.choice(AGENCIES)),
+        ('GPE', lambda: rng.choice(PLACES)),
+        ('EMAIL', lambda: f'{rng.choice(FIRST_NAMES).lower()}.{rng.choice(LAST_NAMES).lower()}'
+                          f'{rng.randint(1, 99)}@example.com'),
+        ('PHONE', lambda: f'({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(1000, 9999)}'),
+        ('SSN', lambda: f'{rng.randint(100, 665)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}'),
+        ('MONEY', lambda: f'${rng.randint(1, 999)},{rng.randint(100, 999)}'),
+    ]
+    entities = {}
+    attempts = 0
+    while len(entities) < count and attempts < count * 50:
+        kind, make = rng.choice(makers)
+        entities.setdefault(make(), kind)
+        attempts += 1
+    return entities
+
+
+def _sentence(rng, entities, entity_density):
+    words = rng.choices(FILLER, k=rng.randint(12, 28))
+    if entities and rng.random() < entity_density:
+        for _ in range(rng.randint(1, 2)):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(entities))
+    words[0] = words[0].capitalize()
+    return ' '.join(words) + '.'
+
+
+def _runs(text, rng, runs_per_paragraph):
+    # Split on word boundaries into up to runs_per_paragraph w:r elements
+    words = text.split(' ')
+    cuts = sorted(rng.sample(range(1, len(words)), min(runs_per_paragraph - 1, len(words) - 1))) if len(words) > 1 else []
+    pieces = [' '.join(words[a:b]) for a, b in zip([0] + cuts, cuts + [len(words)])]
+    pieces = [piece + (' ' if i < len(pieces) - 1 else '') for i, piece in enumerate(pieces)]
+    out = []
+    for i, piece in enumerate(pieces):
+        props = '<w:rPr><w:b/></w:rPr>' if i % 3 == 1 else ''
+        out.append(f'<w:r>{props}<w:t xml:space="preserve">{escape(piece)}</w:t></w:r>')
+    return ''.join(out)
+
+
+def _paragraph(text, rng, runs_per_paragraph=1, style=None):
+    props = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+    return f'<w:p>{props}{_runs(text, rng, runs_per_paragraph)}</w:p>'
+
+
+def _table(rng, rows, cols, entities, entity_density, runs_per_paragraph):
+    cells = []
+    for row in range(rows):
+        cells.append('<w:tr>')
+        for col in range(cols):
+            if row == 0:
+                text = f'Column {col + 1}'
+            else:
+                text = _sentence(rng, entities, entity_density)
+            cells.append(f'<w:tc><w:tcPr><w:tcW w:w="2000" w:type="dxa"/></w:tcPr>'
+                         f'{_paragraph(text, rng, runs_per_paragraph)}</w:tc>')
+        cells.append('</w:tr>')
+    return f'<w:tbl><w:tblPr><w:tblW w:w="0" w:type="auto"/></w:tblPr>{"".join(cells)}</w:tbl>'
+
+
+def generate_docx(path, paragraphs=500, table_every=15, table_rows=4, table_cols=3,
+                  header_lines=2, footer_lines=1, entity_density=0.3, entities=50,
+                  runs_per_paragraph=3, seed=0):
+    """Write one synthetic document to path; returns {entity text: kind} of what it may contain."""
+    rng = random.Random(seed)
+    entity_kinds = make_entities(entities, rng)
+    names = sorted(entity_kinds)
+    client = rng.choice([name for name in names if entity_kinds[name] == 'ORG'] or ['Acme Co'])
+
+    body = [_paragraph('REQUEST FOR PROPOSAL', rng, style='Title'),
+            _paragraph(client, rng, style='Subtitle')]
+    section = 0
+    for i in range(paragraphs):
+        if i % 12 == 0:
+            heading = f'{section + 1}. {SECTIONS[section % len(SECTIONS)]}'
+            body.append(_paragraph(heading, rng, style='Heading1'))
+            section += 1
+        sentences = ' '.join(_sentence(rng, names, entity_density) for _ in range(rng.randint(1, 4)))
+        body.append(_paragraph(sentences, rng, runs_per_paragraph))
+        if table_every and (i + 1) % table_every == 0:
+            body.append(_table(rng, table_rows, table_cols, names, entity_density, runs_per_paragraph))
+    body.append('<w:sectPr><w:headerReference w:type="default" r:id="rId1"/>'
+                '<w:footerReference w:type="default" r:id="rId2"/></w:sectPr>')
+
+    header = ''.join(_paragraph(f'{client} - Confidential - {_sentence(rng, names, entity_density)}', rng)
+                     for _ in range(header_lines))
+    footer = ''.join(_paragraph(f'Contact {rng.choice(names)} for questions. Page', rng)
+                     for _ in range(footer_lines))
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', CONTENT_TYPES)
+        zf.writestr('_rels/.rels', PACKAGE_RELS)
+        zf.writestr('word/_rels/document.xml.rels', DOCUMENT_RELS)
+        zf.writestr('word/document.xml', f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                                         f'<w:document {W_NS}><w:body>{"".join(body)}</w:body></w:document>')
+        zf.writestr('word/header1.xml', f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                                        f'<w:hdr {W_NS}>{header}</w:hdr>')
+        zf.writestr('word/footer1.xml', f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                                        f'<w:ftr {W_NS}>{footer}</w:ftr>')
+    return entity_kinds
+
+
+def add_corpus_arguments(parser):
+    parser.add_argument('--paragraphs', type=int, nargs='+', default=[500])
+    parser.add_argument('--table-every', type=int, default=15, help='Body paragraphs per table (0 = none)')
+    parser.add_argument('--table-rows', type=int, default=4)
+    parser.add_argument('--table-cols', type=int, default=3)
+    parser.add_argument('--header-lines', type=int, default=2)
+    parser.add_argument('--footer-lines', type=int, default=1)
+    parser.add_argument('--entity-density', type=float, default=0.3, help='Share of sentences with an entity')
+    parser.add_argument('--entities', type=int, default=50, help='Distinct entities per document')
+    parser.add_argument('--runs-per-paragraph', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+
+
+def corpus_options(args):
+    return {
+        'table_every': args.table_every,
+        'table_rows': args.table_rows,
+        'table_cols': args.table_cols,
+        'header_lines': args.header_lines,
+        'footer_lines': args.footer_lines,
+        'entity_density': args.entity_density,
+        'entities': args.entities,
+        'runs_per_paragraph': args.runs_per_paragraph,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output_dir')
+    parser.add_argument('--count', type=int, default=1, help='Documents per paragraph count')
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest = []
+    for paragraph_count in args.paragraphs:
+        for n in range(args.count):
+            path = os.path.join(args.output_dir, f'synthetic_{paragraph_count}p_{n}.docx')
+            entity_kinds = generate_docx(path, paragraphs=paragraph_count, seed=args.seed + n,
+                                         **corpus_options(args))
+            manifest.append({'path': path, 'paragraphs': paragraph_count, 'entities': entity_kinds})
+            print(f'{path}: {os.path.getsize(path)} bytes, {len(entity_kinds)} entities', file=sys.stderr)
+    with open(os.path.join(args.output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
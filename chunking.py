@@ -0,0 +1,132 @@
+import bisect
+import re
+from collections import namedtuple
+
+# A slice of the analyzed text. start is the chunk's offset in the full text;
+# entities are only kept when they start inside [own_start, own_end), so
+# overlapping windows never report the same entity twice. clipped marks a
+# window that was cut mid-sentence, whose trailing entities may be truncated.
+# whole marks a chunk made only of complete paragraphs.
+Chunk = namedtuple('Chunk', ['start', 'text', 'own_start', 'own_end', 'clipped', 'whole'])
+
+SENTENCE_END = re.compile(r'(?<=[.!?;:])\s+')
+
+
+def _whole(start, text, whole=True):
+    return Chunk(start, text, start, start + len(text), False, whole)
+
+
+def _split_sentences(start, text):
+    pos = 0
+    for match in SENTENCE_END.finditer(text):
+        yield start + pos, text[pos:match.end()]
+        pos = match.end()
+    if pos < len(text):
+        yield start + pos, text[pos:]
+
+
+def _windows(start, text, max_chars, overlap):
+    # Last resort for a single sentence longer than max_chars
+    step = max(1, max_chars - overlap)
+    half = overlap // 2
+    pos = 0
+    while True:
+        end = min(len(text), pos + max_chars)
+        last = end == len(text)
+        own_start = start + (pos + half if pos else 0)
+        own_end = start + (end if last else end - overlap + half)
+        yield Chunk(start + pos, text[pos:end], own_start, own_end, not last, False)
+        if last:
+            break
+        pos += step
+
+
+def iter_chunks(text, max_chars=5000, overlap=200):
+    """Yield Chunks of at most max_chars, split on paragraph then sentence boundaries."""
+    buffer_start = 0
+    buffer = []
+    size = 0
+    whole = True
+    pos = 0
+    for piece in text.splitlines(keepends=True):
+        if size + len(piece) > max_chars and buffer:
+            yield _whole(buffer_start, ''.join(buffer), whole)
+            buffer, size, whole = [], 0, True
+        if len(piece) > max_chars:
+            for sentence_start, sentence in _split_sentences(pos, piece):
+                if size + len(sentence) > max_chars and buffer:
+                    yield _whole(buffer_start, ''.join(buffer), whole)
+                    buffer, size, whole = [], 0, True
+                if len(sentence) > max_chars:
+                    yield from _windows(sentence_start, sentence, max_chars, overlap)
+                    continue
+                if not buffer:
+                    buffer_start = sentence_start
+                buffer.append(sentence)
+                size += len(sentence)
+                whole = False
+        else:
+            if not buffer:
+                buffer_start = pos
+            buffer.append(piece)
+            size += len(piece)
+        pos += len(piece)
+    if buffer:
+        yield _whole(buffer_start, ''.join(buffer), whole)
+
+
+def chunk_owns(chunk, start, end):
+    if not chunk.own_start <= start < chunk.own_end:
+        return False
+    return not chunk.clipped or end < chunk.start + len(chunk.text)
+
+
+def chunk_paragraphs(chunk):
+    """Yield (offset within chunk, paragraph) for a chunk made of whole paragraphs."""
+    pos = 0
+    for paragraph in chunk.text.splitlines(keepends=True):
+        yield pos, paragraph
+        pos += len(paragraph)
+
+
+class ParagraphSelection:
+    """Some of the paragraphs (lines) of a text, joined back into .text.
+
+    keep has one flag per paragraph of text.split('\\n'). to_text maps an
+    offset in .text back to the full text, so entities found in the selection
+    can be placed in the document.
+    """
+
+    def __init__(self, text, keep):
+        self.full_text = text
+        self._starts = []  # (offset in .text, offset in the full text) per kept paragraph
+        kept = []
+        size = 0
+        pos = 0
+        for paragraph, flag in zip(text.split('\n'), keep):
+            if flag:
+                self._starts.append((size, pos))
+                kept.append(paragraph)
+                size += len(paragraph) + 1
+            pos += len(paragraph) + 1
+        self.complete = len(kept) == text.count('\n') + 1
+        self.text = text if self.complete else '\n'.join(kept)
+        self._keys = [start for start, _ in self._starts]
+
+    def to_text(self, offset):
+        if self.complete:
+            return offset
+        i = max(0, bisect.bisect_right(self._keys, offset) - 1)
+        start, full_start = self._starts[i]
+        return full_start + offset - start
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
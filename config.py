@@ -4,4 +4,107 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key'
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     ALLOWED_EXTENSIONS = {'docx'}
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB limit
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB limit per request; larger files use chunked uploads
+
+    # Resumable chunked uploads (see uploads.py); each chunk is one request
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # Must fit MAX_CONTENT_LENGTH
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 1024 * 1024 * 1024))
+
+    # spaCy model served by the NLP worker pool (see nlp_pool.py)
+    NLP_MODEL = os.environ.get('NLP_MODEL') or 'path_to_your_fine_tuned_model'
+    NLP_FALLBACK_MODEL = os.environ.get('NLP_FALLBACK_MODEL') or 'en_core_web_trf'
+    NLP_POOL_WORKERS = int(os.environ.get('NLP_POOL_WORKERS', 0))  # 0 = load the model in the web process
+    NLP_PRELOAD = os.environ.get('NLP_PRELOAD', '0') == '1'  # Load before forking (e.g. gunicorn --preload)
+
+    # Chunked NER: text is split on paragraph/sentence boundaries and batched through nlp.pipe
+    NER_CHUNK_CHARS = int(os.environ.get('NER_CHUNK_CHARS', 5000))
+    NER_CHUNK_OVERLAP = int(os.environ.get('NER_CHUNK_OVERLAP', 200))  # Only used when a sentence must be cut
+    NER_BATCH_SIZE = int(os.environ.get('NER_BATCH_SIZE', 16))
+    NER_N_PROCESS = int(os.environ.get('NER_N_PROCESS', 1))
+
+    # Entity labels suggest_redactions keeps from NER, and the confidence they need
+    NER_LABELS = ['PERSON', 'ORG', 'GPE', 'DATE', 'MONEY', 'PERCENT', 'QUANTITY', 'PROJECT_NAME', 'COMPANY', 'POSITION_TITLE']
+    NER_CONFIDENCE_THRESHOLD = float(os.environ.get('NER_CONFIDENCE_THRESHOLD', 0.7))
+
+    # Tiered NER (see tiers.py): NLP_FAST_MODEL (a small spaCy pipeline, or 'rules') reads
+    # every paragraph and only entity-dense or ambiguously labelled ones go on to NLP_MODEL
+    NER_TIERS = os.environ.get('NER_TIERS') or 'single'  # 'single' or 'tiered'
+    NLP_FAST_MODEL = os.environ.get('NLP_FAST_MODEL') or 'en_core_web_sm'
+    NER_ESCALATE_DENSITY = float(os.environ.get('NER_ESCALATE_DENSITY', 2.0))  # Entities per 100 characters
+    NER_ESCALATE_LABELS = ['NORP', 'FAC', 'LOC', 'PRODUCT', 'EVENT', 'WORK_OF_ART', 'LAW']  # Often mislabelled kept labels
+    NER_ESCALATE_UNTAGGED = os.environ.get('NER_ESCALATE_UNTAGGED', '1') == '1'  # Capitalised words left untagged
+
+    # Persistent analysis cache keyed on document hash, model and pattern-set version
+    ANALYSIS_CACHE_ENABLED = os.environ.get('ANALYSIS_CACHE_ENABLED', '1') == '1'
+    ANALYSIS_CACHE_PATH = os.environ.get('ANALYSIS_CACHE_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache', 'analysis.sqlite3')
+    ANALYSIS_CACHE_MAX_BYTES = int(os.environ.get('ANALYSIS_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    ANALYSIS_CACHE_MAX_AGE = int(os.environ.get('ANALYSIS_CACHE_MAX_AGE', 30 * 24 * 3600))  # Seconds
+
+    # Gazetteer of entities approved in review (see gazetteer.py): 'assist' adds the known
+    # entities to every analysis, 'first' also keeps paragraphs they fully explain from NER
+    GAZETTEER_MODE = os.environ.get('GAZETTEER_MODE') or 'off'  # 'off', 'assist' or 'first'
+    GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache', 'gazetteer.sqlite3')
+    GAZETTEER_LABELS = ['PERSON', 'ORG', 'GPE', 'PROJECT_NAME', 'COMPANY', 'POSITION_TITLE']  # Recurring names only
+    GAZETTEER_MIN_LENGTH = int(os.environ.get('GAZETTEER_MIN_LENGTH', 3))
+    GAZETTEER_MAX_TERMS = int(os.environ.get('GAZETTEER_MAX_TERMS', 100000))
+    GAZETTEER_RETENTION = int(os.environ.get('GAZETTEER_RETENTION', 30 * 24 * 3600))  # Seconds since last approved; 0 = keep
+
+    # Background analysis jobs (see jobs.py)
+    ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 2))
+    JOB_TTL = int(os.environ.get('JOB_TTL', 3600))  # Seconds a finished job stays pollable
+
+    # Finalize/restore: text parts of at least REDACT_PART_MIN_BYTES (uncompressed XML) are
+    # rewritten in a process pool, cut into pieces of about that size (see part_pool.py)
+    REDACT_PART_WORKERS = int(os.environ.get('REDACT_PART_WORKERS', min(4, os.cpu_count() or 1)))  # 0 = off
+    REDACT_PART_MIN_BYTES = int(os.environ.get('REDACT_PART_MIN_BYTES', 256 * 1024))
+
+    # Batch redaction (batch.py and /api/batch); API paths must live under BATCH_ROOT
+    BATCH_ROOT = os.environ.get('BATCH_ROOT') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'batch')
+    BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1))  # Processes per batch
+    BATCH_JOBS = int(os.environ.get('BATCH_JOBS', 1))  # Batches run at once, apart from analysis jobs
+
+    # Pattern detectors for suggest_redactions (see detectors.py). The sensitive part
+    # can be captured in (?P<value>...); validator is one of detectors.VALIDATORS.
+    DETECTORS = [
+        {'label': 'SSN', 'pattern': r'\b\d{3}-\d{2}-\d{4}\b'},  # Social Security Number
+        {'label': 'EMAIL', 'pattern': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'},
+        {'label': 'CREDIT_CARD', 'pattern': r'\b(?:\d[ -]?){12,18}\d\b', 'validator': 'luhn'},
+        {'label': 'IBAN', 'pattern': r'\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,4})?\b', 'validator': 'iban'},
+        {'label': 'PHONE', 'pattern': r'(?<![\w-])(?:\+?1[ .-]?)?\(?\d{3}\)?[ .-]\d{3}[ .-]\d{4}\b'},
+        {'label': 'IP_ADDRESS', 'pattern': r'\b(?:\d{1,3}\.){3}\d{1,3}\b', 'validator': 'ipv4'},
+        {'label': 'PASSPORT', 'pattern': r'\bpassport(?: (?:no|number))?[.:#]?\s*(?P<value>[A-Z0-9]{6,9})\b', 'ignore_case': True},
+    ]
+    DETECTORS_FILE = os.environ.get('DETECTORS_FILE')  # Optional JSON list of extra definitions
+
+    # Per-job token maps (see token_store.py); tokens are an HMAC keyed on TOKEN_SECRET
+    TOKEN_SECRET = os.environ.get('TOKEN_SECRET') or SECRET_KEY
+    TOKEN_STORE_MAX_SCOPES = int(os.environ.get('TOKEN_STORE_MAX_SCOPES', 1000))
+    TOKEN_STORE_TTL = int(os.environ.get('TOKEN_STORE_TTL', 24 * 3600))  # Seconds idle before a map is dropped
+
+    # Parsed-document index shared by analysis, preview, search and finalize (see document_cache.py)
+    DOCUMENT_CACHE_SIZE = int(os.environ.get('DOCUMENT_CACHE_SIZE', 32))  # Documents kept in memory
+    DOCUMENT_CACHE_TTL = int(os.environ.get('DOCUMENT_CACHE_TTL', 3600))  # Seconds
+
+    # /search pagination (see search_index.py)
+    SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 50))
+    SEARCH_MAX_PAGE_SIZE = int(os.environ.get('SEARCH_MAX_PAGE_SIZE', 500))
+
+    # Last rendered preview per review session (see preview_engine.py)
+    PREVIEW_CACHE_SIZE = int(os.environ.get('PREVIEW_CACHE_SIZE', 64))
+    PREVIEW_CACHE_TTL = int(os.environ.get('PREVIEW_CACHE_TTL', 3600))  # Seconds
+
+    # Review state and redaction maps (see storage.py): 'sqlite' or 'filesystem'
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND') or 'sqlite'
+    STORAGE_PATH = os.environ.get('STORAGE_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'storage')
+    SESSION_RETENTION = int(os.environ.get('SESSION_RETENTION', 24 * 3600))  # Seconds after the last write
+    REDACTION_MAP_RETENTION = int(os.environ.get('REDACTION_MAP_RETENTION', 0))  # 0 = keep for restores
+    STORAGE_SWEEP_INTERVAL = int(os.environ.get('STORAGE_SWEEP_INTERVAL', 3600))  # 0 = no background sweep
+
+    # Observability (see metrics.py): JSON trace per request/job, and opt-in cProfile
+    # dumps requested with ?profile=1 or an X-Profile: 1 header
+    TRACE_LOG = os.environ.get('TRACE_LOG', os.path.join('logs', 'trace.jsonl'))  # Empty = no trace log
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join('logs', 'profiles')
+    PROFILE_MIN_SECONDS = float(os.environ.get('PROFILE_MIN_SECONDS', 1.0))  # Only keep slow runs
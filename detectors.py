@@ -0,0 +1,309 @@
+import hashlib
+import json
+import re
+import threading
+
+from config import Config
+
+# The first-character lookahead reads patterns with the private re parser. It is
+# only an optimisation: without a usable parser registries match without it.
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    try:
+        import sre_constants
+        import sre_parse
+    except ImportError:
+        sre_constants = sre_parse = None
+
+_GROUP = re.compile(r'\(\?P<value>')
+
+try:
+    _CATEGORIES = {
+        sre_constants.CATEGORY_DIGIT: r'\d', sre_constants.CATEGORY_NOT_DIGIT: r'\D',
+        sre_constants.CATEGORY_WORD: r'\w', sre_constants.CATEGORY_NOT_WORD: r'\W',
+        sre_constants.CATEGORY_SPACE: r'\s', sre_constants.CATEGORY_NOT_SPACE: r'\S',
+    }
+    _REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+    if hasattr(sre_constants, 'POSSESSIVE_REPEAT'):
+        _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+except AttributeError:
+    sre_parse = None
+
+
+def _class_items(items):
+    # Character-class body for a parsed IN node, or None if it cannot be rebuilt
+    negated = False
+    body = []
+    for op, av in items:
+        if op is sre_constants.NEGATE:
+            negated = True
+        elif op is sre_constants.LITERAL:
+            body.append(re.escape(chr(av)))
+        elif op is sre_constants.RANGE:
+            body.append(f'{re.escape(chr(av[0]))}-{re.escape(chr(av[1]))}')
+        elif op is sre_constants.CATEGORY and av in _CATEGORIES:
+            body.append(_CATEGORIES[av])
+        else:
+            return None
+    return negated, ''.join(body)
+
+
+def _first(items):
+    # Returns (set of (negated, class body), nullable) for the characters that can
+    # start a match of this parsed sequence, or None when that cannot be bounded
+    found = set()
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            found.add((False, re.escape(chr(av))))
+            return found, False
+        if op is sre_constants.IN:
+            item = _class_items(av)
+            if item is None:
+                return None
+            found.add(item)
+            return found, False
+        if op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            continue  # Zero width; skipping it only widens the set
+        if op is sre_constants.SUBPATTERN:
+            add_flags = av[1]
+            if add_flags & (re.IGNORECASE | re.VERBOSE):
+                return None
+            inner = _first(av[-1])
+        elif op is sre_constants.BRANCH:
+            inner = (set(), False)
+            for branch in av[1]:
+                result = _first(branch)
+                if result is None:
+                    return None
+                inner = (inner[0] | result[0], inner[1] or result[1])
+        elif op in _REPEATS:
+            inner = _first(av[2])
+            if inner is not None and av[0] == 0:
+                inner = (inner[0], True)
+        else:
+            return None
+        if inner is None:
+            return None
+        found |= inner[0]
+        if not inner[1]:
+            return found, False
+    return found, True
+
+
+def first_chars(pattern):
+    """Lookahead source matching every character that can start pattern, or None."""
+    if sre_parse is None:
+        return None
+    try:
+        result = _first(sre_parse.parse(pattern).data)
+    except Exception:  # Parser internals differ between Python versions
+        return None
+    if result is None or result[1] or not result[0]:
+        return None
+    plain = sorted(body for negated, body in result[0] if not negated)
+    negated = sorted(f'[^{body}]' for negated, body in result[0] if negated)
+    classes = ([f'[{"".join(plain)}]'] if plain else []) + negated
+    return '|'.join(classes)
+
+
+def luhn_valid(value):
+    digits = [int(ch) for ch in value if ch.isdigit()]
+    if len(digits) < 12:
+        return False
+    checksum = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        checksum += digit
+    return checksum % 10 == 0
+
+
+def iban_valid(value):
+    compact = re.sub(r'\s+', '', value).upper()
+    if len(compact) < 15 or len(compact) > 34:
+        return False
+    rearranged = compact[4:] + compact[:4]
+    try:
+        return int(''.join(str(int(ch, 36)) for ch in rearranged)) % 97 == 1
+    except ValueError:
+        return False
+
+
+def ssn_valid(value):
+    area, group, serial = value.split('-')
+    return area not in ('000', '666') and not area.startswith('9') and group != '00' and serial != '0000'
+
+
+def ipv4_valid(value):
+    return all(0 <= int(octet) <= 255 for octet in value.split('.'))
+
+
+# Validators that pattern definitions can refer to by name
+VALIDATORS = {
+    'luhn': luhn_valid,
+    'iban': iban_valid,
+    'ssn': ssn_valid,
+    'ipv4': ipv4_valid,
+}
+
+
+class Detector:
+    def __init__(self, label, pattern, validator=None, ignore_case=False, confidence=1.0):
+        if validator is not None and validator not in VALIDATORS:
+            raise ValueError(f"Unknown validator for {label}: {validator}")
+        self.label = label
+        self.pattern = pattern
+        self.validator = validator
+        self.ignore_case = ignore_case
+        self.confidence = confidence
+        self.regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+
+    @classmethod
+    def from_config(cls, definition):
+        return cls(
+            definition['label'],
+            definition['pattern'],
+            validator=definition.get('validator'),
+            ignore_case=definition.get('ignore_case', False),
+            confidence=definition.get('confidence', 1.0),
+        )
+
+    def to_config(self):
+        return {
+            'label': self.label,
+            'pattern': self.pattern,
+            'validator': self.validator,
+            'ignore_case': self.ignore_case,
+            'confidence': self.confidence,
+        }
+
+    def span(self, match, value_group='value', whole_group=0):
+        # Detectors may capture the sensitive part in (?P<value>...), e.g. after a keyword
+        if value_group in match.re.groupindex and match.start(value_group) >= 0:
+            return match.span(value_group)
+        return match.span(whole_group)
+
+    def accepts(self, text):
+        return self.validator is None or VALIDATORS[self.validator](text)
+
+
+class DetectorRegistry:
+    """Pattern detectors compiled into one alternation and run in a single scan.
+
+    Each detector becomes a named group (d0, d1, ...); match.lastgroup tells
+    which one fired. Detectors are grouped by the characters their matches
+    can start with, and each group sits behind a lookahead on those
+    characters, so most positions are rejected after one test no matter how
+    many detectors are registered. Where several detectors match at the same
+    position the earliest registered one wins; when a validator rejects a
+    match, the later detectors are tried at that position before moving on.
+    """
+
+    def __init__(self, detectors):
+        self.detectors = list(detectors)
+        groups = {}
+        for i, detector in enumerate(self.detectors):
+            body = _GROUP.sub(f'(?P<d{i}_value>', detector.pattern)
+            lookahead = first_chars(detector.pattern)
+            if detector.ignore_case:
+                body = f'(?i:{body})'
+                lookahead = f'(?i:{lookahead})' if lookahead else None
+            groups.setdefault(lookahead, []).append((i, f'(?P<d{i}>{body})'))
+        parts = []
+        self._group_of = {}
+        for number, (lookahead, members) in enumerate(groups.items()):
+            branches = '|'.join(branch for _, branch in members)
+            parts.append(f'(?={lookahead})(?:{branches})' if lookahead else branches)
+            for i, _ in members:
+                self._group_of[i] = number
+        self.regex = re.compile('|'.join(parts)) if parts else None
+        self.version = hashlib.sha256(
+            json.dumps([d.to_config() for d in self.detectors], sort_keys=True).encode('utf-8')
+        ).hexdigest()[:16]
+
+    @classmethod
+    def from_config(cls, definitions):
+        return cls(Detector.from_config(definition) for definition in definitions)
+
+    def extend(self, definitions):
+        return DetectorRegistry(self.detectors + [Detector.from_config(d) for d in definitions])
+
+    def __len__(self):
+        return len(self.detectors)
+
+    def _candidates(self, text, match):
+        # Detectors that match at this position, in registration order. Groups
+        # reorder the alternation, so earlier detectors from other groups are
+        # re-checked here; this only runs where something already matched.
+        index = int(match.lastgroup[1:])
+        pos = match.start()
+        group = self._group_of[index]
+        for i, detector in enumerate(self.detectors):
+            if i == index:
+                yield detector, match, f'd{i}_value', f'd{i}'
+            elif i < index and self._group_of[i] == group:
+                continue  # Already failed inside the combined pattern
+            else:
+                retry = detector.regex.match(text, pos)
+                if retry:
+                    yield detector, retry, 'value', 0
+
+    def finditer(self, text):
+        # Yields non-overlapping (start, end, label, confidence) in document order
+        if self.regex is None:
+            return
+        pos = 0
+        while True:
+            match = self.regex.search(text, pos)
+            if match is None:
+                return
+            # When every candidate is rejected, look again one character on: a shorter
+            # match may start inside the rejected span (a phone number after a failed card)
+            resume = match.start() + 1
+            for detector, found, value_group, whole_group in self._candidates(text, match):
+                start, end = detector.span(found, value_group, whole_group)
+                if start < end and detector.accepts(text[start:end]):
+                    yield start, end, detector.label, detector.confidence
+                    resume = max(found.end(), match.start() + 1)
+                    break
+            pos = resume
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def load_definitions():
+    definitions = list(Config.DETECTORS)
+    if Config.DETECTORS_FILE:
+        with open(Config.DETECTORS_FILE, 'r') as f:
+            definitions.extend(json.load(f))
+    return definitions
+
+
+def get_registry(extra_patterns=None):
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = DetectorRegistry.from_config(load_definitions())
+    if extra_patterns:
+        return _extended(json.dumps(extra_patterns, sort_keys=True))
+    return _registry
+
+
+_extended_cache = {}
+
+
+def _extended(key):
+    # Policies reuse the same extra patterns for every file, so keep their compiled registries
+    with _registry_lock:
+        registry = _extended_cache.get(key)
+        if registry is None:
+            if len(_extended_cache) >= 32:
+                _extended_cache.clear()
+            registry = _registry.extend(json.loads(key))
+            _extended_cache[key] = registry
+    return registry
@@ -0,0 +1,173 @@
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from config import Config
+from docx_stream import BODY_PART, iter_paragraphs
+from metrics import span, CACHE_LOOKUPS
+
+INDEX_VERSION = 1
+CONTAINERS = ('body', 'table', 'other')
+
+# One paragraph of the document. runs holds the (start, end) offsets of each
+# w:t segment in text, so edits can be mapped back onto the runs.
+Paragraph = namedtuple('Paragraph', ['part', 'container', 'text', 'runs'])
+
+
+class DocumentIndex:
+    """Extracted text structure of one .docx: every paragraph of the body,
+    table cells, headers and footers, in document order."""
+
+    def __init__(self, paragraphs, source=None):
+        self.paragraphs = paragraphs
+        self.source = source or {}
+        self._body = None
+
+    @classmethod
+    def build(cls, filepath):
+        with span('parse'):
+            paragraphs = [Paragraph(part, container, text, runs)
+                          for part, container, text, runs in iter_paragraphs(filepath)]
+        return cls(paragraphs, _source_stamp(filepath))
+
+    def body_texts(self):
+        # The paragraphs python-docx exposes as Document.paragraphs
+        if self._body is None:
+            self._body = [p.text for p in self.paragraphs if p.part == BODY_PART and p.container == 'body']
+        return self._body
+
+    def parts_matching(self, matcher):
+        # Parts with at least one paragraph the matcher hits; the rest need no rewrite
+        found = set()
+        for paragraph in self.paragraphs:
+            if paragraph.part not in found and matcher.finditer(paragraph.text):
+                found.add(paragraph.part)
+        return found
+
+    def save(self, path):
+        parts = sorted({p.part for p in self.paragraphs})
+        part_ids = {part: i for i, part in enumerate(parts)}
+        payload = {
+            'version': INDEX_VERSION,
+            'source': self.source,
+            'parts': parts,
+            # Compact rows: part id, container id, text, flattened run offsets
+            'paragraphs': [
+                [part_ids[p.part], CONTAINERS.index(p.container), p.text, [o for run in p.runs for o in run]]
+                for p in self.paragraphs
+            ],
+        }
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            payload = json.load(f)
+        if payload.get('version') != INDEX_VERSION:
+            return None
+        parts = payload['parts']
+        paragraphs = [
+            Paragraph(parts[part], CONTAINERS[container], text, list(zip(flat[::2], flat[1::2])))
+            for part, container, text, flat in payload['paragraphs']
+        ]
+        return cls(paragraphs, payload['source'])
+
+
+def _source_stamp(filepath):
+    stat = os.stat(filepath)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def index_path(filepath):
+    # Saved next to the upload so it is cleaned up along with it. Files outside
+    # UPLOAD_FOLDER (batch inputs) get no index file: their folders may belong
+    # to the user or be read-only.
+    folder = os.path.realpath(Config.UPLOAD_FOLDER)
+    if os.path.commonpath([folder, os.path.realpath(filepath)]) != folder:
+        return None
+    return f"{os.path.splitext(filepath)[0]}_index.json.gz"
+
+
+class DocumentCache:
+    """In-memory LRU/TTL of DocumentIndex objects backed by index files on disk."""
+
+    def __init__(self, max_entries=32, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, filepath):
+        key = os.path.abspath(filepath)
+        stamp = _source_stamp(filepath)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl and entry[1].source == stamp:
+                self._entries.move_to_end(key)
+                self._entries[key] = (now, entry[1])
+                self.hits += 1
+                CACHE_LOOKUPS.inc(cache='document_index', result='hit')
+                return entry[1]
+            self.misses += 1
+
+        index = None
+        saved = index_path(filepath)
+        if saved and os.path.exists(saved):
+            try:
+                index = DocumentIndex.load(saved)
+            except (OSError, ValueError, KeyError, EOFError):
+                index = None
+            if index is not None and index.source != stamp:
+                index = None  # The upload changed since the index was written
+        if index is None:
+            CACHE_LOOKUPS.inc(cache='document_index', result='miss')
+            index = DocumentIndex.build(filepath)
+            if saved:
+                try:
+                    index.save(saved)
+                except OSError:
+                    pass  # Only the disk copy is lost; the index is still cached in memory
+        else:
+            CACHE_LOOKUPS.inc(cache='document_index', result='disk')
+
+        with self._lock:
+            self._entries[key] = (now, index)
+            self._entries.move_to_end(key)
+            self._prune(now)
+        return index
+
+    def discard(self, filepath):
+        with self._lock:
+            self._entries.pop(os.path.abspath(filepath), None)
+
+    def _prune(self, now):
+        expired = [key for key, (touched, _) in self._entries.items() if now - touched > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_document_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DocumentCache(max_entries=Config.DOCUMENT_CACHE_SIZE, ttl=Config.DOCUMENT_CACHE_TTL)
+    return _cache
+
+
+def get_document_index(filepath):
+    return get_document_cache().get(filepath)
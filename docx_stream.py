@@ -0,0 +1,499 @@
+import io
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from xml.etree import ElementTree
+from xml.parsers import expat
+from xml.sax import make_parser
+from xml.sax.handler import ContentHandler, feature_namespaces
+from xml.sax.saxutils import XMLGenerator, quoteattr
+
+# Streaming access to the text of a .docx without building a python-docx object
+# tree. Parts are read straight from the zip: text extraction uses iterparse and
+# drops each element once it is done, rewriting uses SAX and only buffers the
+# paragraph being processed, and every other part is copied through unchanged.
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W = f'{{{W_NS}}}'
+
+BODY_PART = 'word/document.xml'
+HEADER_FOOTER_PART = re.compile(r'^word/(header|footer)\d*\.xml$')
+XML_DECLARATION = b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n'
+COPY_BUFFER = 1024 * 1024
+
+
+def text_parts(zf):
+    # The body first, then header and footer parts in zip order
+    names = [info.filename for info in zf.infolist()]
+    parts = [BODY_PART] if BODY_PART in names else []
+    return parts + [name for name in names if HEADER_FOOTER_PART.match(name)]
+
+
+def part_kind(part):
+    if part == BODY_PART:
+        return 'body'
+    return HEADER_FOOTER_PART.match(part).group(1)
+
+
+def _paragraph_text(p):
+    # Same characters python-docx reports for Paragraph.text, skipping nested
+    # paragraphs (text boxes), which are reported on their own. Also returns the
+    # (start, end) offsets of each w:t run segment within that text.
+    parts = []
+    runs = []
+    size = 0
+
+    def add(piece, is_run=False):
+        nonlocal size
+        if is_run:
+            runs.append((size, size + len(piece)))
+        parts.append(piece)
+        size += len(piece)
+
+    def walk(element):
+        for child in element:
+            tag = child.tag
+            if tag in (W + 'p', W + 'pPr'):
+                continue  # Nested paragraphs are separate; pPr holds tab stops, not tabs
+            if tag == W + 't':
+                add(child.text or '', is_run=True)
+            elif tag in (W + 'tab', W + 'ptab'):
+                add('\t')
+            elif tag == W + 'cr':
+                add('\n')
+            elif tag == W + 'br':
+                # Page and column breaks do not count as text, like python-docx
+                if child.get(W + 'type', 'textWrapping') == 'textWrapping':
+                    add('\n')
+            elif tag == W + 'noBreakHyphen':
+                add('-')
+            else:
+                walk(child)
+
+    walk(p)
+    return ''.join(parts), runs
+
+
+def iter_part_paragraphs(stream):
+    """Yield (container, text, runs) for every paragraph of one XML part, in order.
+
+    container is 'body' for top-level body paragraphs, 'table' for paragraphs
+    inside table cells and 'other' for anything else (text boxes, content
+    controls, header and footer paragraphs).
+    """
+    stack = []
+    for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            stack.append(element)
+            continue
+        stack.pop()
+        parent = stack[-1] if stack else None
+        if element.tag == W + 'p':
+            if parent is not None and parent.tag == W + 'body':
+                container = 'body'
+            elif any(ancestor.tag == W + 'tc' for ancestor in stack):
+                container = 'table'
+            else:
+                container = 'other'
+            text, runs = _paragraph_text(element)
+            yield container, text, runs
+            element.clear()
+        if parent is not None and parent.tag == W + 'body':
+            # Finished top-level block; drop it so memory does not grow with the document
+            parent.remove(element)
+
+
+def iter_paragraphs(filepath, kinds=('body', 'header', 'footer')):
+    """Yield (part, container, text, runs) for the paragraphs of the selected parts."""
+    with zipfile.ZipFile(filepath) as zf:
+        for part in text_parts(zf):
+            if part_kind(part) not in kinds:
+                continue
+            with zf.open(part) as stream:
+                for container, text, runs in iter_part_paragraphs(stream):
+                    yield part, container, text, runs
+
+
+def body_paragraph_texts(filepath):
+    # The paragraphs python-docx exposes as Document.paragraphs
+    for _, container, text, _ in iter_paragraphs(filepath, kinds=('body',)):
+        if container == 'body':
+            yield text
+
+
+def apply_edits(segments, edits, fixed=()):
+    """Apply (start, end, replacement) edits on ''.join(segments) to the segments themselves.
+
+    segments are the pieces of one paragraph's text and edits are sorted and
+    do not overlap. A replacement goes into the segment where its span starts;
+    the rest of a span that crosses into later segments is cut from them, so
+    a term Word split over several runs ends up in the first of them. The
+    segments whose indexes are in fixed (tabs and breaks) are never changed:
+    a replacement starting in one goes to the start of the next segment that
+    can be changed, or the end of the last one.
+    Returns the new segment texts, one per segment.
+    """
+    result = []
+    k = 0
+    pos = 0
+    carry = ''  # Replacements of edits that start in a fixed segment
+    last = None  # Index of the last segment that can be changed
+    for i, segment in enumerate(segments):
+        end = pos + len(segment)
+        if i in fixed:
+            while k < len(edits) and edits[k][0] < end:
+                start, stop, replacement = edits[k]
+                if start >= pos:
+                    carry += replacement
+                if stop > end:
+                    break  # Continues into the next segment
+                k += 1
+            result.append(segment)
+            pos = end
+            continue
+        pieces = [carry]
+        carry = ''
+        cursor = pos
+        while k < len(edits) and edits[k][0] < end:
+            start, stop, replacement = edits[k]
+            if start >= cursor:
+                pieces.append(segment[cursor - pos:start - pos])
+                pieces.append(replacement)
+            cursor = max(cursor, min(stop, end))
+            if stop > end:
+                break  # Continues into the next segment
+            k += 1
+        pieces.append(segment[cursor - pos:])
+        result.append(''.join(pieces))
+        last = i
+        pos = end
+    if carry and last is not None:
+        result[last] += carry
+    return result
+
+
+# Elements _paragraph_text reports as characters; w:br only counts as '\n'
+# when it is a text-wrapping break
+_FIXED_TEXT = {'tab': '\t', 'ptab': '\t', 'cr': '\n', 'noBreakHyphen': '-'}
+
+
+class _Paragraph:
+    def __init__(self):
+        self.events = []
+        # The paragraph text in pieces: [index of a w:t event in events, None] for
+        # text, [None, character] for tabs and breaks, which edits cannot change
+        self.pieces = []
+        self.current_text = None
+        self.properties = 0  # Depth inside w:pPr, whose w:tab elements are tab stops
+
+
+class _RewriteHandler(ContentHandler):
+    """Replays SAX events to an XMLGenerator, rewriting paragraph text.
+
+    Events inside a w:p are buffered until the paragraph ends. transform gets
+    the paragraph text as the index sees it (w:t text plus tabs and breaks)
+    and returns (start, end, replacement) edits on it; only the w:t elements
+    those spans touch are changed, so the runs keep their formatting (see
+    apply_edits). Nested paragraphs are transformed on their own and kept
+    opaque in their parent. With skip_root the root element itself is not
+    written, only what is inside it (see rewrite_block_range).
+    """
+
+    def __init__(self, out, transform, skip_root=False):
+        super().__init__()
+        self.out = XMLGenerator(out, encoding='utf-8', short_empty_elements=True)
+        self.transform = transform
+        self.skip_root = skip_root
+        self.stack = []
+        # prefix -> namespace URI in scope, one entry per open element
+        self.namespaces = [{'xml': 'http://www.w3.org/XML/1998/namespace'}]
+
+    def _emit(self, event):
+        if self.stack:
+            self.stack[-1].events.append(event)
+        else:
+            self._write(event)
+
+    def _write(self, event):
+        kind = event[0]
+        if kind == 'start':
+            self.out.startElement(event[1], event[2])
+        elif kind == 'end':
+            self.out.endElement(event[1])
+        elif kind == 'chars':
+            self.out.characters(event[1])
+        elif kind == 'text':
+            self.out.startElement(event[1], event[2])
+            if event[3]:
+                self.out.characters(event[3])
+            self.out.endElement(event[1])
+        elif kind == 'pi':
+            self.out.processingInstruction(event[1], event[2])
+
+    def _local_name(self, name):
+        # Local name of a WordprocessingML element, whatever prefix the document bound it to
+        prefix, _, local = name.rpartition(':')
+        return local if self.namespaces[-1].get(prefix) == W_NS else None
+
+    def _attribute(self, attrs, local):
+        # Value of a WordprocessingML attribute such as w:type, or None
+        for key, value in attrs.items():
+            prefix, _, name = key.rpartition(':')
+            if name == local and prefix and self.namespaces[-1].get(prefix) == W_NS:
+                return value
+        return None
+
+    def startElement(self, name, attrs):
+        namespaces = self.namespaces[-1]
+        declared = {key.partition(':')[2]: value for key, value in attrs.items()
+                    if key == 'xmlns' or key.startswith('xmlns:')}
+        if declared:
+            namespaces = dict(namespaces, **declared)
+        self.namespaces.append(namespaces)
+        if self.skip_root and len(self.namespaces) == 2:
+            return
+        local = self._local_name(name)
+        if local == 'p':
+            self.stack.append(_Paragraph())
+        paragraph = self.stack[-1] if self.stack else None
+        if paragraph is not None and local is not None:
+            if local == 'pPr' or paragraph.properties:
+                paragraph.properties += 1
+            elif local == 't':
+                paragraph.pieces.append([len(paragraph.events), None])
+                paragraph.events.append(['text', name, dict(attrs), ''])
+                paragraph.current_text = paragraph.events[-1]
+                return
+            elif local in _FIXED_TEXT:
+                paragraph.pieces.append([None, _FIXED_TEXT[local]])
+            elif local == 'br' and (self._attribute(attrs, 'type') or 'textWrapping') == 'textWrapping':
+                paragraph.pieces.append([None, '\n'])
+        self._emit(('start', name, dict(attrs)))
+
+    def endElement(self, name):
+        local = self._local_name(name)
+        self.namespaces.pop()
+        if self.skip_root and len(self.namespaces) == 1:
+            return
+        paragraph = self.stack[-1] if self.stack else None
+        if paragraph is not None and local is not None:
+            if paragraph.properties:
+                paragraph.properties -= 1
+            elif local == 't':
+                paragraph.current_text = None
+                return
+        self._emit(('end', name))
+        if local == 'p':
+            self._finish(self.stack.pop())
+
+    def characters(self, content):
+        paragraph = self.stack[-1] if self.stack else None
+        if paragraph is not None and paragraph.current_text is not None:
+            paragraph.current_text[3] += content
+        else:
+            self._emit(('chars', content))
+
+    def ignorableWhitespace(self, whitespace):
+        self.characters(whitespace)
+
+    def processingInstruction(self, target, data):
+        self._emit(('pi', target, data))
+
+    def _finish(self, paragraph):
+        if any(index is not None for index, _ in paragraph.pieces):
+            events = [paragraph.events[index] if index is not None else None for index, _ in paragraph.pieces]
+            segments = [event[3] if event is not None else text for event, (_, text) in zip(events, paragraph.pieces)]
+            fixed = {i for i, event in enumerate(events) if event is None}
+            edits = self.transform(''.join(segments))
+            if edits:
+                for event, updated in zip(events, apply_edits(segments, edits, fixed)):
+                    if event is not None and updated != event[3]:
+                        event[3] = updated
+                        if updated != updated.strip():
+                            event[2]['xml:space'] = 'preserve'
+        if self.stack:
+            # Nested paragraph: hand its (already final) events to the parent as-is
+            self.stack[-1].events.extend(('raw', event) for event in paragraph.events)
+        else:
+            for event in paragraph.events:
+                self._replay(event)
+
+    def _replay(self, event):
+        if event[0] == 'raw':
+            self._replay(event[1])
+        else:
+            self._write(event)
+
+
+def rewrite_part(source, target, transform):
+    target.write(XML_DECLARATION)
+    text = io.TextIOWrapper(target, encoding='utf-8', errors='xmlcharrefreplace', newline='\n')
+    parser = make_parser()
+    # Without namespace processing qualified names and xmlns attributes pass through as
+    # written; the handler resolves prefixes itself to find w:p and w:t
+    parser.setFeature(feature_namespaces, False)
+    handler = _RewriteHandler(text, transform)
+    parser.setContentHandler(handler)
+    parser.parse(source)
+    handler.out.endDocument()
+    text.flush()
+    text.detach()  # Leave the zip entry open for the caller to close
+
+
+def rewrite_part_file(src_path, part, dst_path, transform):
+    # Rewrite one text part into a standalone XML file, for rewrite_docx(prepared=...)
+    with zipfile.ZipFile(src_path) as zin, zin.open(part) as source, open(dst_path, 'wb') as target:
+        rewrite_part(source, target, transform)
+    return dst_path
+
+
+class _BlockScanner:
+    # Start offsets of the top-level blocks of a part, from one expat pass without
+    # building anything. Blocks are the children of w:body in the document part and
+    # of the root (w:hdr, w:ftr) elsewhere.
+
+    def __init__(self):
+        self.parser = expat.ParserCreate()
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.XmlDeclHandler = self.declaration
+        self.depth = 0
+        self.container = None  # Depth of the element holding the blocks, once inside it
+        self.starts = []
+        self.end_offset = None
+        self.encoding = None
+        self.declarations = {}
+
+    def declaration(self, version, encoding, standalone):
+        self.encoding = encoding
+
+    def start(self, name, attrs):
+        self.depth += 1
+        if self.container is None:
+            local = name.rpartition(':')[2]
+            if self.depth == 1 or (self.depth == 2 and local == 'body'):
+                self.declarations.update((key, value) for key, value in attrs.items()
+                                         if key == 'xmlns' or key.startswith('xmlns:'))
+                if local != 'document':
+                    self.container = self.depth
+        elif self.depth == self.container + 1 and self.end_offset is None:
+            self.starts.append(self.parser.CurrentByteIndex)
+
+    def end(self, name):
+        if self.depth == self.container and self.end_offset is None:
+            self.end_offset = self.parser.CurrentByteIndex
+        self.depth -= 1
+
+
+def block_ranges(source, target_bytes):
+    """Split a text part into byte ranges of whole top-level blocks (paragraphs, tables, sectPr).
+
+    Consecutive blocks are grouped into ranges of about target_bytes, from the
+    start of the first block to the closing tag of the element holding them;
+    the bytes before and after are the part's own wrapper. Returns (ranges,
+    declarations), the latter being the xmlns attributes in scope for the
+    blocks. ranges is empty for parts that are not UTF-8 or have no blocks.
+    """
+    scanner = _BlockScanner()
+    head = source.read(COPY_BUFFER)
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return [], {}
+    while head and scanner.end_offset is None:
+        scanner.parser.Parse(head, False)
+        head = source.read(COPY_BUFFER)
+    if scanner.end_offset is None or not scanner.starts or \
+            (scanner.encoding or 'utf-8').lower().replace('-', '') != 'utf8':
+        return [], {}
+    ranges = []
+    start = scanner.starts[0]
+    for offset in scanner.starts[1:]:
+        if offset - start >= target_bytes:
+            ranges.append((start, offset))
+            start = offset
+    ranges.append((start, scanner.end_offset))
+    return ranges, scanner.declarations
+
+
+def rewrite_block_range(src_path, part, start, end, declarations, dst_path, transform):
+    # Rewrite bytes start:end of a part (whole blocks, see block_ranges) into dst_path.
+    # The blocks are parsed inside a stand-in root carrying the namespace declarations
+    # of the part's own root, which is not written.
+    with zipfile.ZipFile(src_path) as zin, zin.open(part) as source:
+        source.seek(start)
+        blocks = source.read(end - start)
+    root = '<blocks' + ''.join(f' {key}={quoteattr(value)}' for key, value in declarations.items()) + '>'
+    with open(dst_path, 'wb') as target:
+        text = io.TextIOWrapper(target, encoding='utf-8', errors='xmlcharrefreplace', newline='\n')
+        parser = make_parser()
+        parser.setFeature(feature_namespaces, False)
+        handler = _RewriteHandler(text, transform, skip_root=True)
+        parser.setContentHandler(handler)
+        parser.parse(io.BytesIO(root.encode('utf-8') + blocks + b'</blocks>'))
+        text.flush()
+        text.detach()
+    return dst_path
+
+
+def text_part_sizes(filepath):
+    # Uncompressed size of each text part, in text_parts order
+    with zipfile.ZipFile(filepath) as zf:
+        return {part: zf.getinfo(part).file_size for part in text_parts(zf)}
+
+
+def rewrite_docx(src_path, dst_path, transform, parts=None, prepared=None):
+    """Copy a .docx, passing each paragraph of the body, headers and footers through transform.
+
+    transform takes the paragraph text and returns (start, end, replacement)
+    edits, empty when the paragraph stays as it is.
+
+    parts optionally limits the rewrite to those part names; the remaining
+    text parts are copied through without being parsed. prepared maps part
+    names to a callable returning the path of an already rewritten copy of
+    that part (see rewrite_part_file), which is spliced in as-is; it is only
+    called when the copy reaches that part, so it can wait on a worker.
+    """
+    if os.path.realpath(src_path) == os.path.realpath(dst_path):
+        # The source is still being read while the copy is written
+        raise ValueError(f'Cannot rewrite {src_path} onto itself')
+    prepared = prepared or {}
+    # Written next to dst_path and moved into place, so a failed rewrite leaves no partial file
+    fd, tmp_path = tempfile.mkstemp(suffix='.docx', dir=os.path.dirname(os.path.abspath(dst_path)))
+    try:
+        with zipfile.ZipFile(src_path) as zin, os.fdopen(fd, 'wb') as out, zipfile.ZipFile(out, 'w') as zout:
+            parts = set(text_parts(zin)) if parts is None else set(parts) & set(text_parts(zin))
+            for info in zin.infolist():
+                clone = _copy_info(info)
+                if info.filename in prepared:
+                    path = prepared[info.filename]()
+                    clone.file_size = os.path.getsize(path)
+                    with open(path, 'rb') as source, zout.open(clone, 'w') as target:
+                        shutil.copyfileobj(source, target, COPY_BUFFER)
+                elif info.filename in parts:
+                    # The rewritten size is unknown up front; replacements may grow a part
+                    # past the 4 GiB limit only if it is already close to it
+                    with zin.open(info) as source, zout.open(
+                            clone, 'w', force_zip64=info.file_size > zipfile.ZIP64_LIMIT // 2) as target:
+                        rewrite_part(source, target, transform)
+                else:
+                    # Sizes known up front, so zipfile only uses Zip64 for entries that need it
+                    clone.file_size = info.file_size
+                    with zin.open(info) as source, zout.open(clone, 'w') as target:
+                        shutil.copyfileobj(source, target, COPY_BUFFER)
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return dst_path
+
+
+def _copy_info(info):
+    clone = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    clone.compress_type = info.compress_type
+    clone.external_attr = info.external_attr
+    clone.create_system = info.create_system
+    clone.comment = info.comment
+    clone.extra = info.extra
+    return clone
@@ -0,0 +1,233 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from chunking import ParagraphSelection
+from matcher import TermMatcher
+from metrics import REGISTRY, span
+from config import Config
+
+# Entities reviewers have approved before, kept across uploads until they have
+# not been approved again for GAZETTEER_RETENTION. The same client, project and
+# people names recur in most documents, so a single Aho-Corasick scan finds them
+# without the model. In 'first' mode paragraphs the known entities fully explain
+# are not sent to NER at all. Off by default: approved terms are stored in plain
+# text and shared by every later upload.
+
+GAZETTEER_PARAGRAPHS = REGISTRY.counter(
+    'redaction_gazetteer_paragraphs_total',
+    'Analyzed paragraphs by gazetteer coverage: covered (known entities explain every candidate), '
+    'partial (known entities plus other candidates) or miss (no known entity).', ['result'])
+GAZETTEER_CHARACTERS = REGISTRY.counter(
+    'redaction_gazetteer_characters_total',
+    'Analyzed characters by gazetteer coverage and whether they went to NER.', ['result', 'ner'])
+GAZETTEER_MATCHES = REGISTRY.counter(
+    'redaction_gazetteer_matches_total', 'Known entities found by the gazetteer, by label.', ['label'])
+
+# Words that may be an entity the gazetteer does not know: capitalised words and numbers
+CANDIDATE = re.compile(r"\b(?:[A-Z][\w&'-]*|\d[\d,.:/-]*)")
+
+Match = namedtuple('Match', ['start', 'end', 'term', 'label'])
+
+
+def _word_bounded(text, start, end):
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+class Gazetteer:
+    """SQLite-backed set of approved entities and their labels, with a cached matcher.
+
+    Every write bumps a version stored next to the entities, so each process
+    rebuilds its automaton when another one has added terms.
+    """
+
+    def __init__(self, path, max_terms=100000, min_length=3):
+        self.path = path
+        self.max_terms = max_terms
+        self.min_length = min_length
+        self._lock = threading.Lock()
+        self._matcher = None
+        self._matcher_version = None
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entities ('
+            ' term TEXT PRIMARY KEY, label TEXT NOT NULL,'
+            ' approvals INTEGER NOT NULL, approved REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entities_approved ON entities (approved)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER)')
+        self._conn.execute('INSERT OR IGNORE INTO meta (id, version) VALUES (0, 0)')
+        self._conn.commit()
+
+    def add(self, entities):
+        # entities maps term -> label; returns how many were stored
+        now = time.time()
+        rows = [(term, label, now) for term, label in entities.items()
+                if len(term.strip()) >= self.min_length and label in Config.GAZETTEER_LABELS]
+        if not rows:
+            return 0
+        with self._lock:
+            self._conn.executemany(
+                'INSERT INTO entities (term, label, approvals, approved) VALUES (?, ?, 1, ?)'
+                ' ON CONFLICT (term) DO UPDATE SET label = excluded.label,'
+                ' approvals = approvals + 1, approved = excluded.approved',
+                rows,
+            )
+            count = self._conn.execute('SELECT COUNT(*) FROM entities').fetchone()[0]
+            if count > self.max_terms:
+                # Forget the entities approved longest ago
+                self._conn.execute(
+                    'DELETE FROM entities WHERE term IN (SELECT term FROM entities ORDER BY approved LIMIT ?)',
+                    (count - self.max_terms,))
+            self._conn.execute('UPDATE meta SET version = version + 1')
+            self._conn.commit()
+        return len(rows)
+
+    def remove(self, terms):
+        with self._lock:
+            self._conn.executemany('DELETE FROM entities WHERE term = ?', [(term,) for term in terms])
+            self._conn.execute('UPDATE meta SET version = version + 1')
+            self._conn.commit()
+
+    def version(self):
+        with self._lock:
+            return self._conn.execute('SELECT version FROM meta').fetchone()[0]
+
+    def matcher(self):
+        # TermMatcher of term -> label, rebuilt only when the stored version moved
+        version = self.version()
+        with self._lock:
+            if self._matcher is None or self._matcher_version != version:
+                rows = self._conn.execute('SELECT term, label FROM entities').fetchall()
+                self._matcher = TermMatcher(dict(rows))
+                self._matcher_version = version
+            return self._matcher
+
+    def find(self, text, matcher=None):
+        """Known entities in text as Matches, leftmost-longest and on word boundaries."""
+        matcher = matcher or self.matcher()
+        return [
+            Match(start, end, term, matcher.replacements[term])
+            for start, end, term in matcher.finditer(text)
+            if _word_bounded(text, start, end)
+        ]
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute('SELECT COUNT(*) FROM entities').fetchone()[0]
+            version = self._conn.execute('SELECT version FROM meta').fetchone()[0]
+        return {'entities': count, 'version': version}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM entities')
+            self._conn.execute('UPDATE meta SET version = version + 1')
+            self._conn.commit()
+
+    def expire(self, cutoff):
+        # Forget entities last approved before cutoff; returns how many
+        with self._lock:
+            expired = self._conn.execute('DELETE FROM entities WHERE approved < ?', (cutoff,)).rowcount
+            if expired:
+                self._conn.execute('UPDATE meta SET version = version + 1')
+            self._conn.commit()
+        return expired
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def uncovered_candidates(paragraph, spans):
+    # True when a capitalised word or number lies outside the (start, end, ...)
+    # spans. A capitalised word opening a sentence only counts when the next word
+    # is capitalised too ("The report" is not a candidate, "Jane Doe said" is).
+    masked = list(paragraph)
+    for start, end, *_ in spans:
+        masked[start:end] = '#' * (end - start)
+    masked = ''.join(masked)
+    for candidate in CANDIDATE.finditer(masked):
+        if candidate.group()[0].isupper():
+            before = masked[max(0, candidate.start() - 100):candidate.start()].rstrip().rstrip('"\')]')
+            if not before or before[-1] in '.!?:;':
+                following = masked[candidate.end():candidate.end() + 2]
+                if not (following[:1] == ' ' and following[1:2].isupper()):
+                    continue
+        return True
+    return False
+
+
+class GazetteerScan:
+    """Known entities in a text (in its coordinates) and the ParagraphSelection
+    of it that still needs NER."""
+
+    def __init__(self, matches, selection):
+        self.matches = matches
+        self.selection = selection
+
+
+def scan(text, gazetteer, skip_covered=False):
+    """Find known entities paragraph by paragraph; with skip_covered, leave the
+    paragraphs they fully explain out of the NER text."""
+    with span('gazetteer'):
+        matcher = gazetteer.matcher()
+        matches = []
+        keep = []
+        pos = 0
+        for paragraph in text.split('\n'):
+            found = gazetteer.find(paragraph, matcher) if matcher else []
+            if not found:
+                result = 'miss'
+            elif uncovered_candidates(paragraph, found):
+                result = 'partial'
+            else:
+                result = 'covered'
+            skip = skip_covered and result == 'covered'
+            GAZETTEER_PARAGRAPHS.inc(result=result)
+            GAZETTEER_CHARACTERS.inc(len(paragraph), result=result, ner='skipped' if skip else 'sent')
+            for match in found:
+                GAZETTEER_MATCHES.inc(label=match.label)
+                matches.append(match._replace(start=match.start + pos, end=match.end + pos))
+            keep.append(not skip)
+            pos += len(paragraph) + 1
+    return GazetteerScan(matches, ParagraphSelection(text, keep))
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    global _gazetteer
+    if Config.GAZETTEER_MODE == 'off':
+        return None
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            _gazetteer = Gazetteer(
+                Config.GAZETTEER_PATH,
+                max_terms=Config.GAZETTEER_MAX_TERMS,
+                min_length=Config.GAZETTEER_MIN_LENGTH,
+            )
+    return _gazetteer
+
+
+def expire_entities(cutoff):
+    # Retention for the storage sweeper. Also applies to a store left behind
+    # after GAZETTEER_MODE was turned off.
+    gazetteer = get_gazetteer()
+    if gazetteer is not None:
+        return gazetteer.expire(cutoff)
+    if not os.path.exists(Config.GAZETTEER_PATH):
+        return 0
+    gazetteer = Gazetteer(Config.GAZETTEER_PATH)
+    try:
+        return gazetteer.expire(cutoff)
+    finally:
+        gazetteer.close()
@@ -0,0 +1,165 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from functools import partial
+
+from storage import get_storage
+from config import Config
+
+# Seconds between progress writes to storage while a job runs
+PUBLISH_INTERVAL = 0.5
+
+
+class Job:
+    def __init__(self, kind, func, args, kwargs):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = 'queued'
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.published = 0.0
+
+    def set_progress(self, done, total):
+        self.done = done
+        self.total = total
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': {
+                'done': self.done,
+                'total': self.total,
+                'percent': round(100.0 * self.done / self.total, 1) if self.total else 0.0,
+            },
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class JobManager:
+    """In-process job queue drained by a fixed number of background threads.
+
+    Job functions receive a progress(done, total) keyword argument. Finished
+    jobs are kept for job_ttl seconds so clients can poll their final state.
+    With storage (a callable returning the Storage), job state is also written
+    there, so any web worker can answer a poll for a job another one runs.
+    """
+
+    def __init__(self, workers=2, job_ttl=3600, storage=None):
+        self.workers = workers
+        self.job_ttl = job_ttl
+        self.storage = storage
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, kind, func, *args, **kwargs):
+        job = Job(kind, func, args, kwargs)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._publish(job)
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def state(self, job_id):
+        # Job.to_dict() of a job run by this process, or as another process stored it
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.storage is None:
+            return None
+        return self.storage().get_job(job_id)
+
+    def _publish(self, job):
+        if self.storage is not None:
+            job.published = time.time()
+            self.storage().put_job(job.id, job.to_dict())
+
+    def _progress(self, job, done, total):
+        job.set_progress(done, total)
+        if time.time() - job.published >= PUBLISH_INTERVAL:
+            self._publish(job)
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {'workers': self.workers, 'queued': self._queue.qsize(), 'jobs': counts}
+
+    def _prune(self):
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.status = 'running'
+            job.started = time.time()
+            try:
+                self._publish(job)
+                job.result = job.func(*job.args, progress=partial(self._progress, job), **job.kwargs)
+                job.status = 'done'
+            except Exception as e:
+                job.error = str(e)
+                job.status = 'failed'
+                job.traceback = traceback.format_exc()
+            finally:
+                job.finished = time.time()
+                self._queue.task_done()
+            try:
+                self._publish(job)
+            except Exception:
+                pass  # Keep the worker thread; this process still answers polls for the job
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(workers=Config.ANALYSIS_WORKERS, job_ttl=Config.JOB_TTL, storage=get_storage)
+    return _manager
+
+
+_batch_manager = None
+
+
+def get_batch_manager():
+    # Batches can run for hours, so they get their own threads instead of
+    # queueing uploads behind them on the analysis workers
+    global _batch_manager
+    with _manager_lock:
+        if _batch_manager is None:
+            _batch_manager = JobManager(workers=Config.BATCH_JOBS, job_ttl=Config.JOB_TTL, storage=get_storage)
+    return _batch_manager
@@ -0,0 +1,134 @@
+import re
+from collections import deque
+
+# Term sets up to this size are matched with one compiled regular expression,
+# which scans in C; larger ones (a big gazetteer) use the Aho-Corasick automaton,
+# which is slower per character but much cheaper to build
+REGEX_MAX_TERMS = 20000
+
+
+def _trie_pattern(node):
+    # Regular expression for a trie node: one branch per next character (chains
+    # without choices collapsed into a literal), with the end of a term as the
+    # optional last choice, so the longest term starting at a position wins
+    branches = []
+    for ch, child in node.items():
+        if ch:
+            chain = [ch]
+            while len(child) == 1 and '' not in child:
+                (ch, child), = child.items()
+                chain.append(ch)
+            branches.append(re.escape(''.join(chain)) + _trie_pattern(child))
+    if not branches:
+        return ''
+    if len(branches) == 1 and '' not in node:
+        return branches[0]
+    body = '(?:' + '|'.join(branches) + ')'
+    return body + '?' if '' in node else body
+
+
+def compile_terms(terms):
+    """Regex matching any of terms, leftmost-longest like the automaton; None if it cannot be built."""
+    root = {}
+    for term in terms:
+        node = root
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+    try:
+        return re.compile(_trie_pattern(root))
+    except (RecursionError, re.error, OverflowError):
+        return None  # Deeply nested term sets (e.g. 'a', 'aa', 'aaa', ...)
+
+
+# Multi-pattern matcher used to rewrite text containers in a single scan
+# instead of calling str.replace once per term.
+class TermMatcher:
+    def __init__(self, replacements):
+        # replacements maps each term to the text it should be replaced with
+        self.replacements = {term: value for term, value in replacements.items() if term}
+        self._regex = None
+        if 0 < len(self.replacements) <= REGEX_MAX_TERMS:
+            self._regex = compile_terms(self.replacements)
+        if self._regex is None:
+            self._goto = [{}]
+            self._fail = [0]
+            self._out = [()]
+            for term in self.replacements:
+                self._add(term)
+            self._build()
+
+    def __len__(self):
+        return len(self.replacements)
+
+    def __bool__(self):
+        return bool(self.replacements)
+
+    def _add(self, term):
+        state = 0
+        for ch in term:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] = (len(term),)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # Longest lengths first so ties on start resolve to the longest term
+                self._out[nxt] = tuple(sorted(set(self._out[nxt] + self._out[self._fail[nxt]]), reverse=True))
+
+    def finditer(self, text):
+        # Returns non-overlapping (start, end, term) matches, leftmost-longest
+        if not self.replacements or not text:
+            return []
+        if self._regex is not None:
+            return [(match.start(), match.end(), match.group()) for match in self._regex.finditer(text)]
+        goto, fail, out = self._goto, self._fail, self._out
+        candidates = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = i + 1
+                for length in out[state]:
+                    candidates.append((end - length, -length))
+        if not candidates:
+            return []
+        candidates.sort()
+        matches = []
+        last_end = 0
+        for start, neg_length in candidates:
+            if start >= last_end:
+                last_end = start - neg_length
+                matches.append((start, last_end, text[start:last_end]))
+        return matches
+
+    def sub(self, text):
+        # Returns the rewritten text and the terms that were replaced in it
+        matches = self.finditer(text)
+        if not matches:
+            return text, []
+        parts = []
+        pos = 0
+        for start, end, term in matches:
+            parts.append(text[pos:start])
+            parts.append(self.replacements[term])
+            pos = end
+        parts.append(text[pos:])
+        return ''.join(parts), [term for _, _, term in matches]
@@ -0,0 +1,270 @@
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import Config
+
+# In-process metrics in the Prometheus text format, timing spans per processing
+# stage and a structured JSON trace per request or background job. Each process
+# keeps its own numbers; with several web workers, scrape each one.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(name, '')) for name in self.labelnames), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = (('le', repr(float(bound))),)
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}')
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, (("le", "+Inf"),))} {series[-2]}')
+                lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {series[-2]}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram(
+    'redaction_stage_seconds', 'Time spent in each processing stage.', ['stage'])
+REQUEST_SECONDS = REGISTRY.histogram(
+    'redaction_request_seconds', 'Time spent handling HTTP requests.', ['endpoint', 'method', 'status'])
+DOCUMENTS = REGISTRY.counter(
+    'redaction_documents_total', 'Documents processed, by operation.', ['operation'])
+ENTITIES = REGISTRY.counter(
+    'redaction_entities_total', 'Suggested redactions, by entity label.', ['label'])
+CACHE_LOOKUPS = REGISTRY.counter(
+    'redaction_cache_lookups_total', 'Cache lookups, by cache and result.', ['cache', 'result'])
+
+
+class Trace:
+    """Spans and fields recorded while handling one request or background job."""
+
+    def __init__(self, name, **fields):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.fields = fields
+        self.spans = []
+        self.started = time.time()
+        self._clock = time.perf_counter()
+
+    def add_span(self, stage, started, seconds):
+        self.spans.append({
+            'stage': stage,
+            'start_ms': round((started - self._clock) * 1000, 3),
+            'ms': round(seconds * 1000, 3),
+        })
+
+    def elapsed(self):
+        return time.perf_counter() - self._clock
+
+    def to_dict(self):
+        return {
+            'trace_id': self.id,
+            'name': self.name,
+            'timestamp': self.started,
+            'duration_ms': round(self.elapsed() * 1000, 3),
+            **self.fields,
+            'spans': self.spans,
+        }
+
+
+_current = contextvars.ContextVar('trace', default=None)
+trace_logger = logging.getLogger('redaction_tool.trace')
+trace_logger.propagate = False
+
+
+def current_trace():
+    return _current.get()
+
+
+def start_trace(name, **fields):
+    trace = Trace(name, **fields)
+    return trace, _current.set(trace)
+
+
+def finish_trace(trace, token):
+    _current.reset(token)
+    if trace_logger.handlers:
+        trace_logger.info(json.dumps(trace.to_dict(), default=str))
+
+
+@contextmanager
+def tracing(name, **fields):
+    trace, token = start_trace(name, **fields)
+    try:
+        yield trace
+    except Exception as e:
+        trace.fields['error'] = str(e)
+        raise
+    finally:
+        finish_trace(trace, token)
+
+
+def observe(stage, seconds, started=None):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current.get()
+    if trace is not None:
+        trace.add_span(stage, started if started is not None else time.perf_counter() - seconds, seconds)
+
+
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started, started)
+
+
+class StageTimer:
+    """Accumulates time over many short sections (e.g. per paragraph) into one span."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.elapsed = 0.0
+        self.started = None
+        self._entered = None
+
+    def __enter__(self):
+        self._entered = time.perf_counter()
+        if self.started is None:
+            self.started = self._entered
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed += time.perf_counter() - self._entered
+
+    def record(self):
+        if self.started is not None:
+            observe(self.stage, self.elapsed, self.started)
+
+
+def timed(iterable, stage):
+    # Times only the work done producing each item, not the consumer's
+    timer = StageTimer(stage)
+    iterator = iter(iterable)
+    try:
+        while True:
+            with timer:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        timer.record()
+
+
+@contextmanager
+def profiling(name, enabled=True, min_seconds=None):
+    """cProfile the block; the stats are kept only when it ran for min_seconds or more.
+
+    The .prof file goes to PROFILE_DIR and its path is added to the current trace.
+    """
+    if not enabled:
+        yield None
+        return
+    min_seconds = Config.PROFILE_MIN_SECONDS if min_seconds is None else min_seconds
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler per process; skip this one
+        yield None
+        return
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if time.perf_counter() - started >= min_seconds:
+            os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+            path = os.path.join(Config.PROFILE_DIR, f"{name}.prof")
+            profiler.dump_stats(path)
+            trace = _current.get()
+            if trace is not None:
+                trace.fields['profile'] = path
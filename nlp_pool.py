@@ -0,0 +1,307 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from chunking import batched
+from config import Config
+
+# Model owned by the current process (a pool worker, or the web process itself
+# when the pool runs inline). Loaded lazily so importing redactor stays cheap.
+_nlp = None
+_nlp_lock = threading.Lock()
+
+# Fast-tier pipelines (see tiers.py) by name, owned by the process the same way
+_fast_models = {}
+_fast_lock = threading.Lock()
+
+RULES = 'rules'  # NLP_FAST_MODEL for the fast tier that needs no pipeline
+
+
+def load_model(model_name=None, fallback_model=None):
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            import spacy
+            try:
+                _nlp = spacy.load(model_name or Config.NLP_MODEL)  # Fine-tuned model
+            except Exception:
+                _nlp = spacy.load(fallback_model or Config.NLP_FALLBACK_MODEL)  # Fallback to default model
+    return _nlp
+
+
+def get_nlp():
+    return _nlp if _nlp is not None else load_model()
+
+
+def configured_fast_model():
+    # The fast-tier pipeline to load alongside the main model, if any
+    if Config.NER_TIERS != 'tiered' or Config.NLP_FAST_MODEL == RULES:
+        return None
+    return Config.NLP_FAST_MODEL
+
+
+def load_fast_model(model_name):
+    with _fast_lock:
+        if model_name not in _fast_models:
+            import spacy
+            _fast_models[model_name] = spacy.load(model_name)
+    return _fast_models[model_name]
+
+
+def model_id():
+    # Identifies the loaded pipeline so cached analysis is tied to the model that produced it
+    meta = getattr(get_nlp(), 'meta', {}) or {}
+    return f"{meta.get('lang', '')}_{meta.get('name', '')}-{meta.get('version', '')}"
+
+
+def entities_from_doc(doc):
+    # Plain tuples so results can cross the process boundary cheaply
+    return [
+        (ent.text, ent.label_, ent.start_char, ent.end_char, getattr(ent._, 'confidence', 0.9))
+        for ent in doc.ents
+    ]
+
+
+def extract_entities(text):
+    return entities_from_doc(get_nlp()(text))
+
+
+def extract_entities_batch(texts, batch_size=16, n_process=1):
+    docs = get_nlp().pipe(texts, batch_size=batch_size, n_process=n_process)
+    return [entities_from_doc(doc) for doc in docs]
+
+
+def extract_fast_entities_batch(texts, model_name, batch_size=16):
+    docs = load_fast_model(model_name).pipe(texts, batch_size=batch_size)
+    return [entities_from_doc(doc) for doc in docs]
+
+
+def _load_models(model_name, fallback_model, fast_model):
+    load_model(model_name, fallback_model)
+    if fast_model:
+        load_fast_model(fast_model)
+
+
+def _init_worker(model_name, fallback_model, fast_model=None):
+    _load_models(model_name, fallback_model, fast_model)
+
+
+def _ping():
+    return model_id()
+
+
+class NLPPool:
+    """Pool of processes that each hold one loaded copy of the spaCy model.
+
+    With workers=0 the model is loaded in the calling process instead. With
+    preload=True the model is loaded before the workers are forked, so they
+    share its memory copy-on-write. fast_model, the fast-tier pipeline, is
+    loaded the same way next to it.
+    """
+
+    def __init__(self, workers=0, model_name=None, fallback_model=None, preload=False, fast_model=None):
+        self.workers = workers
+        self.model_name = model_name or Config.NLP_MODEL
+        self.fallback_model = fallback_model or Config.NLP_FALLBACK_MODEL
+        self.fast_model = fast_model
+        self.preload = preload
+        self._executor = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self.error = None
+        self.started_at = None
+        self.model_id = None
+
+    def start(self, wait=False):
+        with self._lock:
+            if self.started_at is not None:
+                return self
+            self.started_at = time.time()
+            if self.workers <= 0:
+                thread = threading.Thread(target=self._warm_inline, daemon=True)
+                thread.start()
+            else:
+                self._start_executor()
+        if wait:
+            self.wait_ready()
+        return self
+
+    def _warm_inline(self):
+        try:
+            _load_models(self.model_name, self.fallback_model, self.fast_model)
+            self.model_id = model_id()
+        except Exception as e:
+            self.error = str(e)
+        self._ready.set()
+
+    def _start_executor(self):
+        if self.preload and 'fork' in multiprocessing.get_all_start_methods():
+            _load_models(self.model_name, self.fallback_model, self.fast_model)
+            context = multiprocessing.get_context('fork')
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        else:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.model_name, self.fallback_model, self.fast_model),
+            )
+        warmups = [self._executor.submit(_ping) for _ in range(self.workers)]
+        threading.Thread(target=self._await_warmups, args=(warmups,), daemon=True).start()
+
+    def _await_warmups(self, warmups):
+        try:
+            for future in warmups:
+                self.model_id = future.result()
+        except Exception as e:
+            self.error = str(e)
+        self._ready.set()
+
+    def wait_ready(self, timeout=None):
+        if self.started_at is None:
+            self.start()
+        if not self._ready.wait(timeout):
+            return False
+        if self.error:
+            raise RuntimeError(f"NLP pool failed to start: {self.error}")
+        return True
+
+    def submit(self, func, *args):
+        self.wait_ready()
+        with self._lock:
+            self._pending += 1
+        if self._executor is None:
+            future = _run_inline(func, *args)
+        else:
+            future = self._executor.submit(func, *args)
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    def extract_entities(self, text):
+        return self.submit(extract_entities, text).result()
+
+    def extract_entities_chunked(self, chunks, batch_size=None, n_process=None):
+        """Yield (chunk, entities) for each chunk, in order, batching through nlp.pipe.
+
+        Chunks are consumed lazily and only a bounded number of batches is in
+        flight, so memory does not grow with the size of the document.
+        """
+        batch_size = batch_size or Config.NER_BATCH_SIZE
+        n_process = n_process or Config.NER_N_PROCESS
+        self.wait_ready()
+        if self._executor is None:
+            docs = get_nlp().pipe(((chunk.text, chunk) for chunk in chunks),
+                                  as_tuples=True, batch_size=batch_size, n_process=n_process)
+            for doc, chunk in docs:
+                yield chunk, entities_from_doc(doc)
+            return
+
+        # Pool workers are daemonic and cannot fork again, so parallelism comes
+        # from spreading batches over the workers instead of n_process
+        yield from self._spread(batched(chunks, batch_size), lambda batch: self.submit(
+            extract_entities_batch, [c.text for c in batch], batch_size))
+
+    def extract_fast_entities(self, texts, model_name=None, batch_size=None):
+        """Yield the entities the fast-tier pipeline finds in each text, in order (see tiers.py)."""
+        model_name = model_name or self.fast_model
+        batch_size = batch_size or Config.NER_BATCH_SIZE
+        self.wait_ready()
+        if self._executor is None:
+            for doc in load_fast_model(model_name).pipe(texts, batch_size=batch_size):
+                yield entities_from_doc(doc)
+            return
+        for _, entities in self._spread(batched(texts, batch_size), lambda batch: self.submit(
+                extract_fast_entities_batch, batch, model_name, batch_size)):
+            yield entities
+
+    def _spread(self, batches, submit):
+        # Yields (item, result) in order with at most two batches per worker in flight
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append((batch, submit(batch)))
+            if len(in_flight) >= self.workers * 2:
+                yield from self._drain(in_flight.popleft())
+        while in_flight:
+            yield from self._drain(in_flight.popleft())
+
+    def _drain(self, item):
+        batch, future = item
+        yield from zip(batch, future.result())
+
+    def health(self):
+        with self._lock:
+            return {
+                'ready': self._ready.is_set() and self.error is None,
+                'mode': 'inline' if self.workers <= 0 else 'process_pool',
+                'workers': self.workers,
+                'model': self.model_name,
+                'fallback_model': self.fallback_model,
+                'fast_model': self.fast_model,
+                'model_id': self.model_id,
+                'pending': self._pending,
+                'completed': self._completed,
+                'failed': self._failed,
+                'uptime': time.time() - self.started_at if self.started_at else 0,
+                'error': self.error,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def _run_inline(func, *args):
+    future = Future()
+    try:
+        future.set_result(func(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = NLPPool(
+                workers=Config.NLP_POOL_WORKERS,
+                preload=Config.NLP_PRELOAD,
+                fast_model=configured_fast_model(),
+            ).start()
+    return _pool
+
+
+def _reset_after_fork():
+    # A forked child (e.g. a gunicorn --preload worker) gets the parent's executor
+    # without its management thread, so submitting to it would hang. Each process
+    # starts its own pool instead; an already loaded model is kept and shared.
+    # A load still running in another thread of the parent never finishes here:
+    # _nlp is only set once spacy.load returns, so the child sees no model, and
+    # the locks that thread held are replaced so the child can load its own.
+    global _pool, _pool_lock, _nlp_lock, _fast_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+    _nlp_lock = threading.Lock()
+    _fast_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
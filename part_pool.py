@@ -0,0 +1,163 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from docx_stream import (COPY_BUFFER, block_ranges, rewrite_block_range, rewrite_docx, rewrite_part_file,
+                         text_part_sizes)
+from matcher import TermMatcher
+from config import Config
+
+# The body and each header/footer of a .docx are separate XML parts, so large
+# ones can be rewritten in worker processes and spliced back into one package.
+# A large part is itself cut between its top-level paragraphs and tables, which
+# are rewritten independently and joined back in order.
+# A header shared by several sections is a single part, so it is rewritten once.
+
+
+class PartTransform:
+    """Picklable rewrite_docx transform that turns a TermMatcher's matches into edits.
+
+    Keeps replacement -> original for every term it replaced, and the time
+    spent replacing, including what workers report back for their parts.
+    """
+
+    def __init__(self, matcher):
+        self.replacements = matcher.replacements
+        self.replaced = {}
+        self.elapsed = 0.0  # In this process
+        self.worker_elapsed = 0.0
+        self._matcher = matcher
+
+    def __getstate__(self):
+        # Workers rebuild the automaton from the replacements instead of unpickling it
+        return dict(self.__dict__, _matcher=None)
+
+    def __call__(self, text):
+        started = time.perf_counter()
+        if self._matcher is None:
+            self._matcher = TermMatcher(self.replacements)
+        edits = []
+        for start, end, original in self._matcher.finditer(text):
+            replacement = self.replacements[original]
+            self.replaced[replacement] = original
+            edits.append((start, end, replacement))
+        self.elapsed += time.perf_counter() - started
+        return edits
+
+
+def _rewrite_part(src_path, part, dst_path, transform):
+    # Runs in a worker; only what the transform found is sent back
+    rewrite_part_file(src_path, part, dst_path, transform)
+    return transform.replaced, transform.elapsed
+
+
+def _rewrite_range(src_path, part, start, end, declarations, dst_path, transform):
+    rewrite_block_range(src_path, part, start, end, declarations, dst_path, transform)
+    return transform.replaced, transform.elapsed
+
+
+def _collect(transform, path, future):
+    replaced, elapsed = future.result()
+    transform.replaced.update(replaced)
+    transform.worker_elapsed += elapsed
+    return path
+
+
+def _splice(transform, src_path, part, path, pieces):
+    # Reassemble a split part: its own head and tail around the rewritten block ranges
+    with zipfile.ZipFile(src_path) as zin, zin.open(part) as source, open(path, 'wb') as target:
+        target.write(source.read(pieces[0][0]))
+        for _, _, piece_path, future in pieces:
+            with open(_collect(transform, piece_path, future), 'rb') as piece:
+                shutil.copyfileobj(piece, target, COPY_BUFFER)
+        source.seek(pieces[-1][1])
+        shutil.copyfileobj(source, target, COPY_BUFFER)
+    return path
+
+
+def _split(src_path, part, size):
+    # Byte ranges of whole blocks, about one per REDACT_PART_MIN_BYTES and at most
+    # two per worker; an empty list keeps the part in one piece
+    count = min(size // Config.REDACT_PART_MIN_BYTES, Config.REDACT_PART_WORKERS * 2)
+    if count < 2:
+        return [], {}
+    with zipfile.ZipFile(src_path) as zin, zin.open(part) as source:
+        ranges, declarations = block_ranges(source, size // count)
+    return (ranges, declarations) if len(ranges) >= 2 else ([], {})
+
+
+def rewrite_docx_parallel(src_path, dst_path, transform, parts=None):
+    """rewrite_docx that hands text parts of REDACT_PART_MIN_BYTES or more to the part pool.
+
+    Large parts, usually the body, are split into ranges of whole top-level
+    blocks (paragraphs and tables) so several workers share one part; smaller
+    parts are rewritten here while the workers run. When that leaves fewer
+    than two pieces, or the pool is disabled, this is a plain rewrite_docx.
+    A worker that dies breaks the pool: it is replaced for the next call and
+    this document is rewritten here instead.
+    """
+    sizes = text_part_sizes(src_path)
+    selected = [part for part in sizes if parts is None or part in parts]
+    large = [part for part in selected if sizes[part] >= Config.REDACT_PART_MIN_BYTES]
+    if Config.REDACT_PART_WORKERS <= 0 or not large:
+        return rewrite_docx(src_path, dst_path, transform, parts=selected)
+    splits = {part: _split(src_path, part, sizes[part]) for part in large}
+    if sum(len(ranges) or 1 for ranges, _ in splits.values()) < 2:
+        return rewrite_docx(src_path, dst_path, transform, parts=selected)
+
+    executor = get_part_executor()
+    workdir = tempfile.mkdtemp(prefix='parts_', dir=os.path.dirname(os.path.abspath(dst_path)))
+    futures = []
+    try:
+        prepared = {}
+        for i, part in enumerate(large):
+            ranges, declarations = splits[part]
+            path = os.path.join(workdir, f'{i}.xml')
+            if not ranges:
+                futures.append(executor.submit(_rewrite_part, src_path, part, path, transform))
+                prepared[part] = partial(_collect, transform, path, futures[-1])
+                continue
+            pieces = []
+            for j, (start, end) in enumerate(ranges):
+                piece_path = os.path.join(workdir, f'{i}_{j}.xml')
+                futures.append(executor.submit(
+                    _rewrite_range, src_path, part, start, end, declarations, piece_path, transform))
+                pieces.append((start, end, piece_path, futures[-1]))
+            prepared[part] = partial(_splice, transform, src_path, part, path, pieces)
+        return rewrite_docx(src_path, dst_path, transform, parts=selected, prepared=prepared)
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        return rewrite_docx(src_path, dst_path, transform, parts=selected)
+    finally:
+        # Let workers finish with the temp files before removing them, even on failure
+        wait(futures)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_part_executor():
+    global _executor
+    if Config.REDACT_PART_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=Config.REDACT_PART_WORKERS)
+    return _executor
+
+
+def _discard_executor(executor):
+    # A broken pool rejects every later submit, so the next call starts a new one
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+from docx_stream import BODY_PART
+from matcher import TermMatcher
+from search_index import get_search_index
+
+
+class PreviewState:
+    """Last preview rendered for one review session.
+
+    replacements is what each approved term rendered as; term_paragraphs maps
+    each of those terms to the preview paragraphs containing it, so a change
+    to a term only re-renders the paragraphs it can appear in.
+    """
+
+    def __init__(self, search_index):
+        self.search_index = search_index
+        # Preview paragraphs are the top-level body paragraphs, as in get_preview
+        self.positions = [i for i, p in enumerate(search_index.paragraphs)
+                          if p.part == BODY_PART and p.container == 'body']
+        self.preview_of = {i: n for n, i in enumerate(self.positions)}
+        self.texts = [search_index.paragraphs[i].text for i in self.positions]
+        self.rendered = list(self.texts)
+        self.replacements = {}
+        self.term_paragraphs = {}
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def paragraphs_for(self, term):
+        found = self.term_paragraphs.get(term)
+        if found is None:
+            found = [self.preview_of[i] for i in self.search_index.paragraphs_containing(term)
+                     if i in self.preview_of]
+            self.term_paragraphs[term] = found
+        return found
+
+    def update(self, replacements):
+        """Render with the new replacements; returns the (paragraph, text) pairs that changed."""
+        changed_terms = {term for term in self.replacements.keys() | replacements.keys()
+                         if self.replacements.get(term) != replacements.get(term)}
+        if not changed_terms:
+            return []
+        affected = set()
+        for term in changed_terms:
+            affected.update(self.paragraphs_for(term))
+        matcher = TermMatcher(replacements)
+        changes = []
+        for n in sorted(affected):
+            text = matcher.sub(self.texts[n])[0]
+            if text != self.rendered[n]:
+                self.rendered[n] = text
+                changes.append((n, text))
+        self.replacements = dict(replacements)
+        # Terms no longer approved keep their paragraph lists; they are cheap and may come back
+        self.version += 1
+        return changes
+
+
+class PreviewEngine:
+    """Preview states per session key, evicted least-recently-used and after ttl seconds idle."""
+
+    def __init__(self, max_entries=64, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, key, filepath):
+        search_index = get_search_index(filepath)
+        now = time.time()
+        with self._lock:
+            entry = self._states.get(key)
+            if entry is None or now - entry[0] > self.ttl or entry[1].search_index is not search_index:
+                # New session, expired, or the document was re-parsed: start from the source text
+                entry = (now, PreviewState(search_index))
+            self._states[key] = (now, entry[1])
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+            return entry[1]
+
+    def render(self, key, filepath, replacements, since=None):
+        """Bring the preview for key up to date with replacements.
+
+        Returns {'version', 'full', 'paragraphs' or 'changes'}. When since is
+        the version the caller already shows, only the paragraphs that changed
+        are returned; otherwise the whole preview is.
+        """
+        state = self._state(key, filepath)
+        with state.lock:
+            previous = state.version
+            changes = state.update(replacements)
+            if since is not None and since == previous:
+                return {
+                    'version': state.version,
+                    'full': False,
+                    'changes': [{'paragraph': n, 'text': text} for n, text in changes],
+                }
+            return {'version': state.version, 'full': True, 'paragraphs': list(state.rendered)}
+
+    def discard(self, key):
+        with self._lock:
+            self._states.pop(key, None)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_preview_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = PreviewEngine(max_entries=Config.PREVIEW_CACHE_SIZE, ttl=Config.PREVIEW_CACHE_TTL)
+    return _engine
@@ -1,65 +1,194 @@
-import spacy
-import re
-from docx import Document
-import uuid
+import os
+import time
+from matcher import TermMatcher
+from part_pool import PartTransform, rewrite_docx_parallel
+from document_cache import get_document_index
+from search_index import get_search_index
+from nlp_pool import get_pool
+from chunking import iter_chunks, chunk_owns, chunk_paragraphs, batched, ParagraphSelection
+from analysis_cache import get_cache, cache_key, file_digest, text_digest
+from detectors import get_registry
+from gazetteer import get_gazetteer, scan
+from tiers import triage, tier_id
+from token_store import get_token_store
+from metrics import span, observe, timed, DOCUMENTS, ENTITIES
+from config import Config
 
-# Load the fine-tuned spaCy model (Replace with your custom model path)
-try:
-    nlp = spacy.load("path_to_your_fine_tuned_model")  # Fine-tuned model
-except:
-    nlp = spacy.load("en_core_web_trf")  # Fallback to default model
+def generate_token_for_term(term, scope=None):
+    # Tokens are scoped to a redaction job (the upload's file_id in the web flow)
+    # and derived deterministically, so every worker produces the same one
+    return get_token_store().get(scope).token_for(term)
 
-# Global token map for consistent replacement
-token_map = {}
+def analyze_document(filepath, progress=None, extra_patterns=None, token_scope=None):
+    DOCUMENTS.inc(operation='analyze')
+    suggestions = _analyze_document(filepath, progress, extra_patterns, token_scope)
+    for info in suggestions.values():
+        ENTITIES.inc(label=info['type'])
+    return suggestions
+
+def _analyze_document(filepath, progress=None, extra_patterns=None, token_scope=None):
+    # Identical bytes analyzed by the same model and pattern set reuse the cached suggestions
+    cache = get_cache()
+    if cache is not None:
+        # The registry version changes whenever a detector definition does
+        key = cache_key(file_digest(filepath), analysis_model_id(), get_registry(extra_patterns).version,
+                        *filter_id(), *gazetteer_version(), *tier_id())
+        cached = cache.get('document', key)
+        if cached is not None:
+            for term, info in cached.items():
+                info['token'] = generate_token_for_term(term, token_scope)
+            if progress:
+                progress(1, 1)
+            return cached
+
+    text = "\n".join(get_document_index(filepath).body_texts())
+    suggestions = suggest_redactions(text, progress=progress, extra_patterns=extra_patterns,
+                                     token_scope=token_scope)
+
+    if cache is not None:
+        # Tokens depend on the job's scope, so they are regenerated on every hit rather than cached
+        cache.put('document', key, {
+            term: {k: v for k, v in info.items() if k != 'token'}
+            for term, info in suggestions.items()
+        })
+    return suggestions
+
+def filter_id():
+    # Which model entities become suggestions
+    return (','.join(Config.NER_LABELS), Config.NER_CONFIDENCE_THRESHOLD)
+
+def gazetteer_version():
+    # Suggestions depend on the known entities too while the gazetteer is on
+    gazetteer = get_gazetteer()
+    return (Config.GAZETTEER_MODE, gazetteer.version()) if gazetteer is not None else ()
 
-def generate_token():
-    return f"[[REDACTED_{uuid.uuid4().hex[:8]}]]"
+def analysis_model_id():
+    pool = get_pool()
+    pool.wait_ready()
+    return pool.model_id
 
-def generate_token_for_term(term):
-    if term not in token_map:
-        token_map[term] = generate_token()
-    return token_map[term]
+def iter_chunk_entities(text):
+    # Yields (chunk, entities) in document order. Chunks made of whole paragraphs
+    # are served from the paragraph cache when all of their paragraphs are known,
+    # so re-uploads with small edits only send changed paragraphs to the model.
+    chunks = iter_chunks(text, max_chars=Config.NER_CHUNK_CHARS, overlap=Config.NER_CHUNK_OVERLAP)
+    pool = get_pool()
+    cache = get_cache()
+    if cache is None:
+        yield from timed(pool.extract_entities_chunked(chunks), 'ner')
+        return
 
-def analyze_document(filepath):
-    doc = Document(filepath)
-    text = "\n".join([para.text for para in doc.paragraphs])
-    return suggest_redactions(text)
+    model = analysis_model_id()
+    for group in batched(chunks, Config.NER_BATCH_SIZE * 4):
+        paragraph_keys = {
+            i: [(offset, len(paragraph), cache_key(text_digest(paragraph), model))
+                for offset, paragraph in chunk_paragraphs(chunk)]
+            for i, chunk in enumerate(group) if chunk.whole
+        }
+        known = cache.get_many('paragraph', [key for keys in paragraph_keys.values() for _, _, key in keys])
+
+        results = {}
+        for i, keys in paragraph_keys.items():
+            if all(key in known for _, _, key in keys):
+                results[i] = [
+                    (ent_text, label, offset + start, offset + end, confidence)
+                    for offset, _, key in keys
+                    for ent_text, label, start, end, confidence in known[key]
+                ]
+
+        misses = [i for i in range(len(group)) if i not in results]
+        fresh = []
+        inferred = timed(pool.extract_entities_chunked(group[i] for i in misses), 'ner')
+        for i, (chunk, entities) in zip(misses, inferred):
+            results[i] = entities
+            for offset, length, key in paragraph_keys.get(i, []):
+                # Each paragraph keeps the entities that start inside it, relative to its start
+                fresh.append((key, [
+                    (ent_text, label, start - offset, stop - offset, confidence)
+                    for ent_text, label, start, stop, confidence in entities
+                    if offset <= start < offset + length
+                ]))
+        if fresh:
+            cache.put_many('paragraph', fresh)
+
+        for i, chunk in enumerate(group):
+            yield chunk, results[i]
+
+def iter_model_entities(text, progress=None):
+    # Yields (ent_text, label, start, end, confidence) with offsets in text. The
+    # main model reads paragraph/sentence chunks through the shared pool.
+    total_paragraphs = text.count('\n') + 1
+    done_paragraphs = 0
+    counted_to = 0
+    for chunk, entities in iter_chunk_entities(text):
+        if progress:
+            chunk_end = chunk.start + len(chunk.text)
+            done_paragraphs += text.count('\n', counted_to, chunk_end)
+            counted_to = max(counted_to, chunk_end)
+            progress(done_paragraphs, total_paragraphs)
+        for ent_text, label, start_char, end_char, confidence in entities:
+            start_char += chunk.start
+            end_char += chunk.start
+            if not chunk_owns(chunk, start_char, end_char):
+                continue  # Reported in full by the neighbouring chunk
+            yield ent_text, label, start_char, end_char, confidence
+
+def iter_entities(text, progress=None):
+    # With NER_TIERS=tiered the fast tier reads every paragraph and only the
+    # ones it escalates reach the main model
+    if Config.NER_TIERS != 'tiered':
+        yield from iter_model_entities(text, progress)
+        return
+    settled = triage(text)
+    yield from settled.entities
+    selection = settled.selection
+    for ent_text, label, start_char, _, confidence in iter_model_entities(selection.text, progress):
+        start_char = selection.to_text(start_char)
+        yield ent_text, label, start_char, start_char + len(ent_text), confidence
 
 # Add more custom patterns if needed
-def suggest_redactions(text):
+def suggest_redactions(text, progress=None, extra_patterns=None, token_scope=None):
     suggestions = {}
+    total_paragraphs = text.count('\n') + 1
+
+    # Known entities first; in 'first' mode the paragraphs they fully explain skip NER
+    gazetteer = get_gazetteer()
+    known = scan(text, gazetteer, skip_covered=Config.GAZETTEER_MODE == 'first') if gazetteer else None
+    selection = known.selection if known else ParagraphSelection(text, [True] * total_paragraphs)
 
-    # Process the text with the NLP model
-    doc = nlp(text)
-
-    for ent in doc.ents:
-        # Assume the model provides confidence scores; you might need to adjust this based on your model
-        confidence = getattr(ent._, 'confidence', 0.9)  # Placeholder confidence score
-        if confidence >= 0.7:  # Use a confidence threshold
-            if ent.label_ in ['PERSON', 'ORG', 'GPE', 'DATE', 'MONEY', 'PERCENT', 'QUANTITY', 'PROJECT_NAME', 'COMPANY', 'POSITION_TITLE']:
-                suggestions[ent.text] = {
-                    'type': ent.label_,
-                    'context': get_context(text, ent.start_char, ent.end_char),
-                    'confidence': confidence,
-                    'token': generate_token_for_term(ent.text)
-                }
-
-    # Add custom patterns for sensitive info like SSNs, Credit Cards, etc.
-    patterns = [
-        (r'\b\d{3}-\d{2}-\d{4}\b', 'SSN'),  # Social Security Number
-        (r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', 'EMAIL'),
-        # Add more patterns as needed
-    ]
-
-    for pattern, label in patterns:
-        for match in re.finditer(pattern, text):
-            suggestions[match.group()] = {
+    # Model entities are mapped back onto the full text
+    for ent_text, label, start_char, end_char, confidence in iter_entities(selection.text, progress):
+        if confidence >= Config.NER_CONFIDENCE_THRESHOLD and label in Config.NER_LABELS:
+            start_char = selection.to_text(start_char)
+            suggestions[ent_text] = {
                 'type': label,
-                'context': get_context(text, match.start(), match.end()),
-                'confidence': 1.0,  # Regular expressions are certain matches
-                'token': generate_token_for_term(match.group())
+                'context': get_context(text, start_char, start_char + len(ent_text)),
+                'confidence': confidence,
+                'token': generate_token_for_term(ent_text, token_scope)
             }
 
+    # Entities a reviewer approved before keep the label they were approved with
+    for match in known.matches if known else ():
+        suggestions[match.term] = {
+            'type': match.label,
+            'context': get_context(text, match.start, match.end),
+            'confidence': 1.0,
+            'token': generate_token_for_term(match.term, token_scope)
+        }
+
+    # Pattern detectors (SSNs, emails, card numbers, ...) run as one compiled scan
+    with span('detect'):
+        for start_char, end_char, label, confidence in get_registry(extra_patterns).finditer(text):
+            term = text[start_char:end_char]
+            suggestions[term] = {
+                'type': label,
+                'context': get_context(text, start_char, end_char),
+                'confidence': confidence,  # Regular expressions are certain matches
+                'token': generate_token_for_term(term, token_scope)
+            }
+
+    if progress:
+        progress(total_paragraphs, total_paragraphs)
     return suggestions
 
 def get_context(text, start, end, context_size=50):
@@ -67,111 +196,78 @@ def get_context(text, start, end, context_size=50):
     context_end = min(len(text), end + context_size)
     return text[context_start:context_end] + '...'
 
-def redact_document(filepath, approved_redactions, redaction_id):
-    doc = Document(filepath)
-    redaction_map = {}
-
-    for para in doc.paragraphs:
-        for original, info in approved_redactions.items():
-            if original in para.text and info['action'] != 'IGNORE':
-                if info['action'] == 'CUSTOM':
-                    replacement = info.get('custom_value', generate_token_for_term(original))
-                elif info['action'] == 'MASK':
-                    replacement = 'X' * len(original)
-                else:  # REDACT
-                    replacement = generate_token_for_term(original)
-                para.text = para.text.replace(original, replacement)
-                redaction_map[replacement] = {'original': original, 'type': info['type']}
-
-    # Process tables
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for original, info in approved_redactions.items():
-                    if original in cell.text and info['action'] != 'IGNORE':
-                        if info['action'] == 'CUSTOM':
-                            replacement = info.get('custom_value', generate_token_for_term(original))
-                        elif info['action'] == 'MASK':
-                            replacement = 'X' * len(original)
-                        else:  # REDACT
-                            replacement = generate_token_for_term(original)
-                        cell.text = cell.text.replace(original, replacement)
-                        redaction_map[replacement] = {'original': original, 'type': info['type']}
-
-    # Process headers and footers
-    for section in doc.sections:
-        header = section.header
-        footer = section.footer
-        for paragraph in header.paragraphs + footer.paragraphs:
-            for original, info in approved_redactions.items():
-                if original in paragraph.text and info['action'] != 'IGNORE':
-                    if info['action'] == 'CUSTOM':
-                        replacement = info.get('custom_value', generate_token_for_term(original))
-                    elif info['action'] == 'MASK':
-                        replacement = 'X' * len(original)
-                    else:  # REDACT
-                        replacement = generate_token_for_term(original)
-                    paragraph.text = paragraph.text.replace(original, replacement)
-                    redaction_map[replacement] = {'original': original, 'type': info['type']}
-
-    redacted_filepath = filepath.replace('.docx', f'_{redaction_id}_redacted.docx')
-    doc.save(redacted_filepath)
+def get_replacement(original, info, token_scope=None):
+    if info['action'] == 'CUSTOM':
+        return info.get('custom_value', generate_token_for_term(original, token_scope))
+    elif info['action'] == 'MASK':
+        return 'X' * len(original)
+    else:  # REDACT
+        return generate_token_for_term(original, token_scope)
+
+def redaction_replacements(approved_redactions, token_scope=None):
+    return {
+        original: get_replacement(original, info, token_scope)
+        for original, info in approved_redactions.items()
+        if info['action'] != 'IGNORE'
+    }
+
+def build_redaction_matcher(approved_redactions, token_scope=None):
+    # Compile every approved term once; the matcher rewrites a paragraph in one pass
+    return TermMatcher(redaction_replacements(approved_redactions, token_scope))
+
+def redacted_path(filepath, redaction_id):
+    # splitext rather than replacing '.docx', which an upload named *.DOCX does not contain
+    return os.path.splitext(filepath)[0] + f'_{redaction_id}_redacted.docx'
+
+def restored_path(redacted_filepath):
+    # Never the input path, even for a redacted file renamed without its _redacted suffix
+    base = os.path.splitext(redacted_filepath)[0]
+    if base.endswith('_redacted'):
+        base = base[:-len('_redacted')]
+    return base + '_restored.docx'
+
+def redact_document(filepath, approved_redactions, redaction_id, output_path=None, token_scope=None):
+    matcher = build_redaction_matcher(approved_redactions, token_scope)
+
+    # Body, table and header/footer paragraphs are rewritten in one streaming pass;
+    # parts the cached index shows no approved term in are copied without parsing,
+    # and large parts are spread over the part pool
+    parts = get_document_index(filepath).parts_matching(matcher)
+    redacted_filepath = output_path or redacted_path(filepath, redaction_id)
+    transform = PartTransform(matcher)
+    started = time.perf_counter()
+    rewrite_docx_parallel(filepath, redacted_filepath, transform, parts=parts)
+    # Replacement runs inside the rewrite; 'save' is the rewrite minus in-process replacement
+    observe('replace', transform.elapsed + transform.worker_elapsed, started)
+    observe('save', time.perf_counter() - started - transform.elapsed, started)
+    DOCUMENTS.inc(operation='redact')
+
+    redaction_map = {
+        replacement: {'original': original, 'type': approved_redactions[original]['type']}
+        for replacement, original in transform.replaced.items()
+    }
     return redacted_filepath, redaction_map
 
 def restore_document(redacted_filepath, redaction_map):
-    doc = Document(redacted_filepath)
-
-    for para in doc.paragraphs:
-        for token, info in redaction_map.items():
-            para.text = para.text.replace(token, info['original'])
-
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for token, info in redaction_map.items():
-                    cell.text = cell.text.replace(token, info['original'])
-
-    # Restore headers and footers
-    for section in doc.sections:
-        header = section.header
-        footer = section.footer
-        for paragraph in header.paragraphs + footer.paragraphs:
-            for token, info in redaction_map.items():
-                paragraph.text = paragraph.text.replace(token, info['original'])
-
-    restored_filepath = redacted_filepath.replace('_redacted.docx', '_restored.docx')
-    doc.save(restored_filepath)
+    matcher = TermMatcher({token: info['original'] for token, info in redaction_map.items()})
+
+    restored_filepath = restored_path(redacted_filepath)
+    with span('restore'):
+        rewrite_docx_parallel(redacted_filepath, restored_filepath, PartTransform(matcher))
+    DOCUMENTS.inc(operation='restore')
     return restored_filepath
 
-def get_preview(filepath, approved_redactions):
-    doc = Document(filepath)
+def get_preview(filepath, approved_redactions, token_scope=None):
+    matcher = build_redaction_matcher(approved_redactions, token_scope)
     preview_text = []
 
-    for para in doc.paragraphs:
-        redacted_para = para.text
-        for original, info in approved_redactions.items():
-            if original in redacted_para and info['action'] != 'IGNORE':
-                if info['action'] == 'CUSTOM':
-                    replacement = info.get('custom_value', generate_token_for_term(original))
-                elif info['action'] == 'MASK':
-                    replacement = 'X' * len(original)
-                else:  # REDACT
-                    replacement = generate_token_for_term(original)
-                redacted_para = redacted_para.replace(original, replacement)
+    for text in get_document_index(filepath).body_texts():
+        redacted_para, _ = matcher.sub(text)
         preview_text.append(redacted_para)
 
     return "\n".join(preview_text)
 
-def search_document(filepath, query):
-    doc = Document(filepath)
-    results = []
-    for i, para in enumerate(doc.paragraphs):
-        if query.lower() in para.text.lower():
-            start = max(0, para.text.lower().index(query.lower()) - 20)
-            end = min(len(para.text), para.text.lower().index(query.lower()) + len(query) + 20)
-            context = para.text[start:end]
-            results.append({
-                'paragraph': i + 1,
-                'context': context
-            })
-    return results
+def search_document(filepath, query, page=1, per_page=None, whole_word=False):
+    # Every occurrence in the body, tables, headers and footers, one page at a time
+    per_page = min(per_page or Config.SEARCH_PAGE_SIZE, Config.SEARCH_MAX_PAGE_SIZE)
+    return get_search_index(filepath).search(query, page=page, per_page=per_page, whole_word=whole_word)
@@ -0,0 +1,219 @@
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from heapq import merge
+
+from docx_stream import part_kind
+from document_cache import get_document_index
+
+TOKEN = re.compile(r'\w+')
+NGRAM = 3
+CONTEXT_CHARS = 20
+
+
+def _word_pattern(query):
+    return re.compile(rf'(?<!\w){re.escape(query)}(?!\w)', re.IGNORECASE)
+
+
+class SearchIndex:
+    """Inverted index over every paragraph of a DocumentIndex.
+
+    tokens maps each lowercased word to the sorted positions it occurs at,
+    positions being offsets into all paragraphs laid end to end one character
+    apart (starts holds where each paragraph begins). A phrase starts where
+    its words, shifted back by their offsets in it, all line up. ngrams maps
+    each lowercased trigram to the sorted ids of the paragraphs containing it,
+    which narrows substring queries down to the paragraphs that need checking.
+    """
+
+    def __init__(self, document_index):
+        self.paragraphs = document_index.paragraphs
+        self.lowered = []
+        self.starts = array('I')
+        self.tokens = {}
+        self.ngrams = {}
+        # Paragraphs whose lowercase form changes length (e.g. a dotted capital I);
+        # their n-grams do not line up with the query, so they are always checked
+        self.irregular = []
+        position = 0
+        for i, paragraph in enumerate(self.paragraphs):
+            self.starts.append(position)
+            position += len(paragraph.text) + 1
+            lowered = paragraph.text.lower()
+            if len(lowered) != len(paragraph.text):
+                self.lowered.append(None)
+                self.irregular.append(i)
+                continue
+            self.lowered.append(lowered)
+            for match in TOKEN.finditer(lowered):
+                self.tokens.setdefault(match.group(), array('I')).append(self.starts[i] + match.start())
+            for gram in {lowered[k:k + NGRAM] for k in range(len(lowered) - NGRAM + 1)}:
+                postings = self.ngrams.get(gram)
+                if postings is None:
+                    postings = self.ngrams[gram] = array('I')
+                postings.append(i)
+
+    def _candidates(self, query):
+        if len(query) < NGRAM:
+            return range(len(self.paragraphs))
+        grams = {query[i:i + NGRAM] for i in range(len(query) - NGRAM + 1)}
+        postings = sorted((self.ngrams.get(gram, ()) for gram in grams), key=len)
+        found = set(postings[0])
+        for other in postings[1:]:
+            if not found:
+                break
+            found.intersection_update(other)
+        found.update(self.irregular)
+        return sorted(found)
+
+    def _rarest_candidates(self, query):
+        # Paragraphs holding the query's rarest trigram, in order and without building
+        # anything, for callers that confirm each one and may stop early
+        if len(query) < NGRAM:
+            return range(len(self.paragraphs))
+        rarest = min((self.ngrams.get(query[i:i + NGRAM], ()) for i in range(len(query) - NGRAM + 1)), key=len)
+        return merge(rarest, self.irregular) if self.irregular else rarest
+
+    def paragraphs_containing(self, term):
+        """Sorted ids of the paragraphs containing term exactly (case-sensitive)."""
+        candidates = self._candidates(term.lower()) if term else []
+        return [i for i in candidates if term in self.paragraphs[i].text]
+
+    def _single_word(self, query):
+        # A one-word whole-word query is answered from its postings alone
+        lowered_query = query.lower()
+        if TOKEN.fullmatch(lowered_query):
+            return self.tokens.get(lowered_query, ())
+        return None
+
+    def _irregular_hits(self, query, pattern):
+        for i in self.irregular:
+            for match in pattern.finditer(self.paragraphs[i].text):
+                yield i, match.start(), match.end()
+
+    def _locate(self, position):
+        i = bisect_right(self.starts, position) - 1
+        return i, position - self.starts[i]
+
+    def _phrase_hits(self, query, pattern):
+        # Where the two rarest words of the query line up is where it can start; the
+        # few positions left are confirmed in place, which also checks the text between words
+        words = sorted(((self.tokens.get(match.group(), ()), match.start())
+                        for match in TOKEN.finditer(query.lower())), key=lambda word: len(word[0]))
+        if not words or not words[0][0]:
+            return
+        (rarest, shift), others = words[0], words[1:]
+        if others:
+            other, other_shift = others[0]
+            delta = other_shift - shift
+            aligned = set(other)
+            aligned.intersection_update([position + delta for position in rarest])
+            starts = sorted(position - other_shift for position in aligned)
+        else:
+            starts = (position - shift for position in rarest)
+        last, end = -1, -1
+        for position in starts:
+            if position < 0:
+                continue
+            i, start = self._locate(position)
+            if i == last and start < end:
+                continue  # Overlaps the previous hit
+            match = pattern.match(self.paragraphs[i].text, start)
+            if match:
+                last, end = i, match.end()
+                yield i, start, end
+
+    def count(self, query, whole_word=False):
+        if not query:
+            return 0
+        postings = self._single_word(query) if whole_word else None
+        if postings is not None:
+            pattern = _word_pattern(query)
+            return len(postings) + sum(1 for _ in self._irregular_hits(query, pattern))
+        return sum(1 for _ in self.find(query, whole_word=whole_word))
+
+    def find(self, query, whole_word=False):
+        """Yield (paragraph id, start, end) for every non-overlapping occurrence of query, in document order.
+
+        Hits are produced lazily, so taking only the first few is cheap.
+        """
+        if not query:
+            return
+        if whole_word:
+            pattern = _word_pattern(query)
+            postings = self._single_word(query)
+            if postings is not None:
+                size = len(query)
+                hits = ((i, start, start + size) for i, start in map(self._locate, postings))
+            else:
+                hits = self._phrase_hits(query, pattern)
+            yield from merge(hits, self._irregular_hits(query, pattern))
+            return
+        lowered_query = query.lower()
+        for i in self._rarest_candidates(lowered_query):
+            lowered = self.lowered[i]
+            if lowered is None:
+                for match in re.finditer(re.escape(query), self.paragraphs[i].text, re.IGNORECASE):
+                    yield i, match.start(), match.end()
+                continue
+            start = lowered.find(lowered_query)
+            while start != -1:
+                yield i, start, start + len(lowered_query)
+                start = lowered.find(lowered_query, start + len(lowered_query))
+
+    def search(self, query, page=1, per_page=50, whole_word=False):
+        """One page of find() results.
+
+        Hits are only looked for up to the end of the page, plus one to tell
+        whether another page follows. total is exact when total_exact is set
+        (the hits ran out, or the query is a single word counted from its
+        postings); otherwise it is a lower bound that includes that next page.
+        """
+        page = max(1, page)
+        per_page = max(1, per_page)
+        first, last = (page - 1) * per_page, page * per_page
+        hits = self.find(query, whole_word=whole_word)
+        results = []
+        seen = 0
+        for i, start, end in hits:
+            seen += 1
+            if seen > first:
+                paragraph = self.paragraphs[i]
+                results.append({
+                    'paragraph': i + 1,
+                    'part': part_kind(paragraph.part),
+                    'container': paragraph.container,
+                    'offset': start,
+                    'context': paragraph.text[max(0, start - CONTEXT_CHARS):end + CONTEXT_CHARS],
+                })
+            if seen == last:
+                break
+        total, exact = seen, seen < last or next(hits, None) is None
+        if not exact:
+            if whole_word and self._single_word(query) is not None:
+                total, exact = self.count(query, whole_word=True), True
+            else:
+                total += 1
+        return {
+            'results': results,
+            'total': total,
+            'total_exact': exact,
+            'page': page,
+            'per_page': per_page,
+            'pages': (total + per_page - 1) // per_page,
+        }
+
+
+_lock = threading.Lock()
+
+
+def get_search_index(filepath):
+    # Kept on the cached DocumentIndex so it lives and expires with it
+    document_index = get_document_index(filepath)
+    with _lock:
+        index = getattr(document_index, 'search_index', None)
+        if index is None:
+            index = SearchIndex(document_index)
+            document_index.search_index = index
+    return index
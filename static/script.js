@@ -127,6 +127,70 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Files too large for a single request go up in chunks through /api/uploads;
+    // a failed chunk is retried from the offset the server reports
+    const uploadForm = document.getElementById('uploadForm');
+    if (uploadForm) {
+        uploadForm.addEventListener('submit', function(event) {
+            const file = document.getElementById('file').files[0];
+            if (!file || file.size <= Number(uploadForm.dataset.maxSingleUpload)) {
+                return;
+            }
+            event.preventDefault();
+            const button = uploadForm.querySelector('input[type="submit"]');
+            button.disabled = true;
+            uploadInChunks(file, function(done, total) {
+                button.value = `Uploading... ${Math.floor(done * 100 / total)}%`;
+            })
+            .then(data => { window.location = data.redirect; })
+            .catch(error => {
+                alert(`Upload failed: ${error.message}`);
+                button.disabled = false;
+                button.value = 'Analyze Document';
+            });
+        });
+    }
+
+    async function uploadJSON(url, options) {
+        const response = await fetch(url, options);
+        const data = await response.json();
+        if (!data.success && response.status !== 409) {
+            throw new Error(data.error || response.statusText);
+        }
+        return data;
+    }
+
+    async function uploadInChunks(file, progress) {
+        const upload = await uploadJSON('/api/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        const url = `/api/uploads/${upload.upload_id}`;
+        let offset = 0;
+        let retries = 0;
+        while (offset < file.size) {
+            const end = Math.min(offset + upload.chunk_size, file.size);
+            try {
+                const data = await uploadJSON(url, {
+                    method: 'PUT',
+                    headers: { 'Content-Range': `bytes ${offset}-${end - 1}/${file.size}` },
+                    body: file.slice(offset, end)
+                });
+                offset = data.offset;
+                retries = 0;
+            } catch (error) {
+                if (++retries > 5) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+                offset = (await uploadJSON(url, { method: 'GET' })).offset;
+            }
+            progress(offset, file.size);
+        }
+        return uploadJSON(`${url}/complete`, { method: 'POST' });
+    }
+
     window.applyToGroup = applyToGroup;
     window.toggleCustomInput = toggleCustomInput;
 });
@@ -0,0 +1,469 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from gazetteer import expire_entities
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only cover threads of one process
+    fcntl = None
+
+# Review state for each upload (suggested and approved redactions), the
+# redaction map of each finalized document and the state of background jobs,
+# shared by every web worker, behind one interface with SQLite
+# and filesystem backends. A sweeper drops sessions past their retention along
+# with their files in UPLOAD_FOLDER, and gazetteer entities past theirs.
+
+KINDS = ('suggested', 'approved')
+LEGACY_MAP = re.compile(r'^(?P<redaction_id>[0-9a-f-]{36})_redaction_map\.json$')
+
+
+class Storage:
+    """Backend interface. Redactions are rows keyed by (file_id, kind, term);
+    get_redactions returns None until that kind has been stored once."""
+
+    def create_session(self, file_id, filepath):
+        raise NotImplementedError
+
+    def get_redactions(self, file_id, kind):
+        raise NotImplementedError
+
+    def put_redactions(self, file_id, kind, redactions):
+        # Replaces every row of this kind in one atomic write
+        raise NotImplementedError
+
+    def update_redactions(self, file_id, kind, changes):
+        # Upserts only the given terms
+        raise NotImplementedError
+
+    def get_redaction_map(self, redaction_id):
+        raise NotImplementedError
+
+    def put_redaction_map(self, redaction_id, file_id, redaction_map):
+        raise NotImplementedError
+
+    def sessions(self):
+        # {file_id: last write time}
+        raise NotImplementedError
+
+    def delete_session(self, file_id):
+        raise NotImplementedError
+
+    def expire_redaction_maps(self, cutoff):
+        raise NotImplementedError
+
+    def get_job(self, job_id):
+        # Background job state as jobs.Job.to_dict() returns it, or None
+        raise NotImplementedError
+
+    def put_job(self, job_id, state):
+        raise NotImplementedError
+
+    def expire_jobs(self, finished_cutoff, stale_cutoff):
+        # Drops jobs finished before finished_cutoff or not updated since stale_cutoff
+        # (their process went away)
+        raise NotImplementedError
+
+    def sweep(self, upload_folder=None, session_ttl=None, map_ttl=None, gazetteer_ttl=None, now=None):
+        """Delete expired sessions, their uploads, stale files and known entities; returns counts."""
+        now = now or time.time()
+        upload_folder = upload_folder or Config.UPLOAD_FOLDER
+        session_ttl = Config.SESSION_RETENTION if session_ttl is None else session_ttl
+        map_ttl = Config.REDACTION_MAP_RETENTION if map_ttl is None else map_ttl
+        gazetteer_ttl = Config.GAZETTEER_RETENTION if gazetteer_ttl is None else gazetteer_ttl
+        cutoff = now - session_ttl
+        live = set()
+        expired = 0
+        for file_id, touched in self.sessions().items():
+            if touched < cutoff:
+                self.delete_session(file_id)
+                expired += 1
+            else:
+                live.add(file_id)
+        removed = 0
+        if os.path.isdir(upload_folder):
+            for entry in os.scandir(upload_folder):
+                if not entry.is_file() or entry.name.split('_', 1)[0] in live:
+                    continue
+                legacy = LEGACY_MAP.match(entry.name)
+                if legacy:
+                    # Maps written before this store existed are still needed to restore documents
+                    self._import_legacy_map(legacy.group('redaction_id'), entry.path)
+                elif entry.stat().st_mtime >= cutoff:
+                    continue
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        maps = self.expire_redaction_maps(now - map_ttl) if map_ttl else 0
+        entities = expire_entities(now - gazetteer_ttl) if gazetteer_ttl else 0
+        jobs = self.expire_jobs(now - Config.JOB_TTL, cutoff)
+        return {'sessions': expired, 'files': removed, 'redaction_maps': maps, 'gazetteer_entities': entities,
+                'jobs': jobs}
+
+    def _import_legacy_map(self, redaction_id, path):
+        if self.get_redaction_map(redaction_id) is not None:
+            return False
+        with open(path, 'r') as f:
+            self.put_redaction_map(redaction_id, None, json.load(f))
+        return True
+
+    def import_legacy_maps(self, upload_folder=None):
+        # Redaction maps saved as JSON files in UPLOAD_FOLDER by earlier versions
+        upload_folder = upload_folder or Config.UPLOAD_FOLDER
+        imported = 0
+        if os.path.isdir(upload_folder):
+            for entry in os.scandir(upload_folder):
+                legacy = LEGACY_MAP.match(entry.name)
+                if legacy and self._import_legacy_map(legacy.group('redaction_id'), entry.path):
+                    imported += 1
+        return imported
+
+
+def _check_kind(kind):
+    if kind not in KINDS:
+        raise ValueError(f"Unknown redaction kind: {kind}")
+
+
+class SQLiteStorage(Storage):
+    """Single SQLite database in WAL mode; each write is one transaction."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            ' file_id TEXT PRIMARY KEY, filepath TEXT, created REAL NOT NULL, touched REAL NOT NULL,'
+            ' suggested_at REAL, approved_at REAL);'
+            'CREATE TABLE IF NOT EXISTS redactions ('
+            ' file_id TEXT NOT NULL, kind TEXT NOT NULL, term TEXT NOT NULL, info TEXT NOT NULL,'
+            ' PRIMARY KEY (file_id, kind, term));'
+            'CREATE TABLE IF NOT EXISTS redaction_maps ('
+            ' redaction_id TEXT PRIMARY KEY, file_id TEXT, created REAL NOT NULL, data TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS sessions_touched ON sessions (touched);'
+            'CREATE INDEX IF NOT EXISTS redaction_maps_created ON redaction_maps (created);'
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' job_id TEXT PRIMARY KEY, updated REAL NOT NULL, finished REAL, state TEXT NOT NULL);'
+        )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def create_session(self, file_id, filepath):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (file_id, filepath, created, touched) VALUES (?, ?, ?, ?)',
+                (file_id, filepath, now, now),
+            )
+
+    def get_redactions(self, file_id, kind):
+        _check_kind(kind)
+        with self._lock:
+            stored = self._conn.execute(
+                f'SELECT {kind}_at FROM sessions WHERE file_id = ?', (file_id,)
+            ).fetchone()
+            if stored is None or stored[0] is None:
+                return None
+            # rowid order is insertion order; upserts keep the row in place
+            rows = self._conn.execute(
+                'SELECT term, info FROM redactions WHERE file_id = ? AND kind = ? ORDER BY rowid',
+                (file_id, kind),
+            ).fetchall()
+        return {term: json.loads(info) for term, info in rows}
+
+    def _touch(self, conn, file_id, kind, now):
+        conn.execute(
+            f'INSERT INTO sessions (file_id, created, touched, {kind}_at) VALUES (?, ?, ?, ?)'
+            f' ON CONFLICT (file_id) DO UPDATE SET touched = excluded.touched, {kind}_at = excluded.{kind}_at',
+            (file_id, now, now, now),
+        )
+
+    def put_redactions(self, file_id, kind, redactions):
+        _check_kind(kind)
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM redactions WHERE file_id = ? AND kind = ?', (file_id, kind))
+            self._upsert(conn, file_id, kind, redactions)
+
+    def update_redactions(self, file_id, kind, changes):
+        _check_kind(kind)
+        with self._transaction() as conn:
+            self._upsert(conn, file_id, kind, changes)
+
+    def _upsert(self, conn, file_id, kind, redactions):
+        conn.executemany(
+            'INSERT INTO redactions (file_id, kind, term, info) VALUES (?, ?, ?, ?)'
+            ' ON CONFLICT (file_id, kind, term) DO UPDATE SET info = excluded.info',
+            [(file_id, kind, term, json.dumps(info)) for term, info in redactions.items()],
+        )
+        self._touch(conn, file_id, kind, time.time())
+
+    def get_redaction_map(self, redaction_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM redaction_maps WHERE redaction_id = ?', (redaction_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_redaction_map(self, redaction_id, file_id, redaction_map):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO redaction_maps (redaction_id, file_id, created, data) VALUES (?, ?, ?, ?)',
+                (redaction_id, file_id, time.time(), json.dumps(redaction_map)),
+            )
+
+    def sessions(self):
+        with self._lock:
+            return dict(self._conn.execute('SELECT file_id, touched FROM sessions').fetchall())
+
+    def delete_session(self, file_id):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM redactions WHERE file_id = ?', (file_id,))
+            conn.execute('DELETE FROM sessions WHERE file_id = ?', (file_id,))
+
+    def expire_redaction_maps(self, cutoff):
+        with self._transaction() as conn:
+            return conn.execute('DELETE FROM redaction_maps WHERE created < ?', (cutoff,)).rowcount
+
+    def get_job(self, job_id):
+        with self._lock:
+            row = self._conn.execute('SELECT state FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_job(self, job_id, state):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO jobs (job_id, updated, finished, state) VALUES (?, ?, ?, ?)',
+                (job_id, time.time(), state.get('finished'), json.dumps(state)),
+            )
+
+    def expire_jobs(self, finished_cutoff, stale_cutoff):
+        with self._transaction() as conn:
+            return conn.execute(
+                'DELETE FROM jobs WHERE finished < ? OR updated < ?', (finished_cutoff, stale_cutoff)
+            ).rowcount
+
+
+class FilesystemStorage(Storage):
+    """One directory per session and one JSON file per redaction map.
+
+    Files are replaced atomically (write to a temp file, then os.replace) under
+    an exclusive lock, so concurrent requests never see or produce a partial
+    file. Row-level updates still rewrite that session's file for the kind.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        for name in ('sessions', 'maps', 'jobs'):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _session_dir(self, file_id):
+        return os.path.join(self.root, 'sessions', os.path.basename(file_id))
+
+    def _map_path(self, redaction_id):
+        return os.path.join(self.root, 'maps', f"{os.path.basename(redaction_id)}.json")
+
+    @contextmanager
+    def _locked(self, directory):
+        with self._lock:
+            os.makedirs(directory, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(directory, '.lock'), 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self, path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path, value):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(value, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _touch(self, directory, filepath=None):
+        path = os.path.join(directory, 'session.json')
+        session = self._read(path) or {'created': time.time()}
+        if filepath is not None:
+            session['filepath'] = filepath
+        session['touched'] = time.time()
+        self._write(path, session)
+
+    def create_session(self, file_id, filepath):
+        directory = self._session_dir(file_id)
+        with self._locked(directory):
+            self._touch(directory, filepath)
+
+    def get_redactions(self, file_id, kind):
+        _check_kind(kind)
+        return self._read(os.path.join(self._session_dir(file_id), f"{kind}.json"))
+
+    def put_redactions(self, file_id, kind, redactions):
+        _check_kind(kind)
+        directory = self._session_dir(file_id)
+        with self._locked(directory):
+            self._write(os.path.join(directory, f"{kind}.json"), redactions)
+            self._touch(directory)
+
+    def update_redactions(self, file_id, kind, changes):
+        _check_kind(kind)
+        directory = self._session_dir(file_id)
+        with self._locked(directory):
+            path = os.path.join(directory, f"{kind}.json")
+            redactions = self._read(path) or {}
+            redactions.update(changes)
+            self._write(path, redactions)
+            self._touch(directory)
+
+    def get_redaction_map(self, redaction_id):
+        stored = self._read(self._map_path(redaction_id))
+        return stored['redaction_map'] if stored else None
+
+    def put_redaction_map(self, redaction_id, file_id, redaction_map):
+        with self._locked(os.path.join(self.root, 'maps')):
+            self._write(self._map_path(redaction_id), {'file_id': file_id, 'redaction_map': redaction_map})
+
+    def sessions(self):
+        found = {}
+        for entry in os.scandir(os.path.join(self.root, 'sessions')):
+            session = self._read(os.path.join(entry.path, 'session.json'))
+            # A directory without session.json is a crashed write; let it expire by its mtime
+            found[entry.name] = session['touched'] if session else entry.stat().st_mtime
+        return found
+
+    def delete_session(self, file_id):
+        shutil.rmtree(self._session_dir(file_id), ignore_errors=True)
+
+    def expire_redaction_maps(self, cutoff):
+        expired = 0
+        for entry in os.scandir(os.path.join(self.root, 'maps')):
+            if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                expired += 1
+        return expired
+
+    def _job_path(self, job_id):
+        return os.path.join(self.root, 'jobs', f"{os.path.basename(job_id)}.json")
+
+    def get_job(self, job_id):
+        return self._read(self._job_path(job_id))
+
+    def put_job(self, job_id, state):
+        # Only the process running a job writes it, and _write replaces the file atomically
+        self._write(self._job_path(job_id), state)
+
+    def expire_jobs(self, finished_cutoff, stale_cutoff):
+        expired = 0
+        for entry in os.scandir(os.path.join(self.root, 'jobs')):
+            if not entry.name.endswith('.json'):
+                continue
+            state = self._read(entry.path) or {}
+            finished = state.get('finished')
+            if (finished and finished < finished_cutoff) or entry.stat().st_mtime < stale_cutoff:
+                try:
+                    os.remove(entry.path)
+                    expired += 1
+                except FileNotFoundError:
+                    pass
+        return expired
+
+
+BACKENDS = {
+    'sqlite': lambda: SQLiteStorage(os.path.join(Config.STORAGE_PATH, 'state.sqlite3')),
+    'filesystem': lambda: FilesystemStorage(Config.STORAGE_PATH),
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if Config.STORAGE_BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown STORAGE_BACKEND: {Config.STORAGE_BACKEND}")
+            _storage = BACKENDS[Config.STORAGE_BACKEND]()
+    return _storage
+
+
+def _sweep_forever(interval, log):
+    while True:
+        time.sleep(interval)
+        try:
+            swept = get_storage().sweep()
+            if log is not None and any(swept.values()):
+                log.info(f'Storage sweep removed {swept}')
+        except Exception:
+            if log is not None:
+                log.exception('Storage sweep failed')  # Retried on the next interval
+
+
+_sweeper = None
+
+
+def start_sweeper(interval=None, log=None):
+    # Background retention sweep for the web process; batch and CLI runs do not need it
+    global _sweeper
+    interval = Config.STORAGE_SWEEP_INTERVAL if interval is None else interval
+    with _storage_lock:
+        if _sweeper is None and interval > 0:
+            _sweeper = threading.Thread(target=_sweep_forever, args=(interval, log),
+                                        name='storage-sweeper', daemon=True)
+            _sweeper.start()
+    return _sweeper
+
+
+# Storage objects a forked child inherited, kept so their connections are never
+# closed from the child
+_inherited = []
+
+
+def _reset_after_fork():
+    # SQLite connections must not be used across fork() (e.g. gunicorn --preload
+    # workers), and the sweeper thread does not survive it. Each process opens its
+    # own connection on first use and starts its own sweeper.
+    global _storage, _storage_lock, _sweeper
+    if _storage is not None:
+        _inherited.append(_storage)
+    _storage = None
+    _storage_lock = threading.Lock()
+    _sweeper = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,165 @@
+import random
+import zipfile
+
+import pytest
+
+from config import Config
+from docx_stream import W_NS, apply_edits, block_ranges, iter_paragraphs, rewrite_docx
+from matcher import TermMatcher
+from part_pool import PartTransform, rewrite_docx_parallel
+
+
+def make_docx(path, body, prefix='w'):
+    # Minimal package: only the parts docx_stream reads
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('[Content_Types].xml', '<Types/>')
+        zf.writestr('word/document.xml', (
+            f'<{prefix}:document xmlns:{prefix}="{W_NS}"><{prefix}:body>{body}</{prefix}:body></{prefix}:document>'
+        ))
+    return str(path)
+
+
+def paragraph(*runs, prefix='w'):
+    return f'<{prefix}:p>' + ''.join(f'<{prefix}:r>{run}</{prefix}:r>' for run in runs) + f'</{prefix}:p>'
+
+
+def text(value, prefix='w'):
+    return f'<{prefix}:t xml:space="preserve">{value}</{prefix}:t>'
+
+
+def texts(path):
+    return [text for _, _, text, _ in iter_paragraphs(path)]
+
+
+def redact(src, dst, replacements):
+    transform = PartTransform(TermMatcher(replacements))
+    rewrite_docx(src, dst, transform)
+    return transform.replaced
+
+
+def random_edits(rng, size):
+    edits = []
+    pos = 0
+    while pos < size:
+        start = rng.randint(pos, size)
+        stop = rng.randint(start, min(size, start + 8))
+        if start == size or rng.random() < 0.3:
+            break
+        edits.append((start, max(stop, start + 1), rng.choice(['', 'X', '[[TOKEN]]'])))
+        pos = max(stop, start + 1)
+    return [edit for edit in edits if edit[1] <= size]
+
+
+def test_apply_edits_matches_editing_the_joined_text():
+    rng = random.Random(1)
+    for _ in range(2000):
+        segments = [''.join(rng.choice('ab ') for _ in range(rng.randint(0, 5))) for _ in range(rng.randint(1, 5))]
+        joined = ''.join(segments)
+        edits = random_edits(rng, len(joined))
+        expected = joined
+        for start, stop, replacement in reversed(edits):
+            expected = expected[:start] + replacement + expected[stop:]
+        assert ''.join(apply_edits(segments, edits)) == expected
+
+
+def test_apply_edits_never_changes_fixed_segments():
+    rng = random.Random(2)
+    for _ in range(2000):
+        segments = []
+        for _ in range(rng.randint(1, 6)):
+            segments.append(rng.choice(['\t', '\n']) if rng.random() < 0.3 else 'abc'[:rng.randint(0, 3)])
+        fixed = {i for i, segment in enumerate(segments) if segment in ('\t', '\n')}
+        edits = random_edits(rng, len(''.join(segments)))
+        result = apply_edits(segments, edits, fixed)
+        assert len(result) == len(segments)
+        for i in fixed:
+            assert result[i] == segments[i]
+        if len(fixed) < len(segments):
+            # Every replacement still lands somewhere
+            written = ''.join(result[i] for i in range(len(result)) if i not in fixed)
+            for _, _, replacement in edits:
+                assert replacement in written
+
+
+def test_apply_edits_moves_a_replacement_starting_on_a_tab_to_the_next_run():
+    assert apply_edits(['Total', '\t', '100'], [(5, 9, '<X>')], {1}) == ['Total', '\t', '<X>']
+    assert apply_edits(['Total', '\t'], [(5, 6, '<X>')], {1}) == ['Total<X>', '\t']
+
+
+def test_rewrite_docx_round_trip_across_runs(tmp_path):
+    src = make_docx(tmp_path / 'in.docx', ''.join([
+        paragraph(text('Contact Alice '), '<w:rPr><w:b/></w:rPr>' + text('Smi'), text('th at Acme Corp.')),
+        paragraph(text('Nothing to see here.')),
+        '<w:tbl><w:tr><w:tc>' + paragraph(text('Acme'), text(' Corp owes Alice Smith')) + '</w:tc></w:tr></w:tbl>',
+    ]))
+    replacements = {'Alice Smith': '[[PERSON_1]]', 'Acme Corp': '[[ORG_1]]'}
+    before = texts(src)
+    redacted = str(tmp_path / 'redacted.docx')
+    replaced = redact(src, redacted, replacements)
+    assert texts(redacted) == [TermMatcher(replacements).sub(value)[0] for value in before]
+    assert replaced == {'[[PERSON_1]]': 'Alice Smith', '[[ORG_1]]': 'Acme Corp'}
+    assert '<w:b/>' in zipfile.ZipFile(redacted).read('word/document.xml').decode()
+
+    restored = str(tmp_path / 'restored.docx')
+    redact(redacted, restored, replaced)
+    assert texts(restored) == [TermMatcher(replacements).sub(value)[0].replace(
+        '[[PERSON_1]]', 'Alice Smith').replace('[[ORG_1]]', 'Acme Corp') for value in before]
+
+
+def test_rewrite_docx_sees_tabs_and_breaks_like_the_index(tmp_path):
+    src = make_docx(tmp_path / 'in.docx', ''.join([
+        '<w:p><w:pPr><w:tabs><w:tab w:val="left" w:pos="720"/></w:tabs></w:pPr>'
+        '<w:r>' + text('Total') + '<w:tab/>' + text('100') + '</w:r></w:p>',
+        paragraph(text('Acme') + '<w:br/>' + text('Corp') + '<w:br w:type="page"/>' + text('Acme')),
+    ]))
+    assert texts(src) == ['Total\t100', 'Acme\nCorpAcme']
+    redacted = str(tmp_path / 'redacted.docx')
+    # The same text the preview matches: a page break adds no character, a tab does
+    redact(src, redacted, {'Total100': 'XXXXXXXX', 'CorpAcme': '[[ORG_1]]'})
+    assert texts(redacted) == ['Total\t100', 'Acme\n[[ORG_1]]']
+
+    redact(src, redacted, {'Total\t100': 'XXXXXXXXX', 'Acme\nCorp': '[[ORG_2]]'})
+    assert texts(redacted) == ['XXXXXXXXX\t', '[[ORG_2]]\nAcme']
+
+
+@pytest.mark.parametrize('prefix', ['w', 'ns0'])
+def test_rewrite_docx_any_namespace_prefix(tmp_path, prefix):
+    src = make_docx(tmp_path / 'in.docx', paragraph(text('Alice Smith', prefix), prefix=prefix), prefix=prefix)
+    redacted = str(tmp_path / 'redacted.docx')
+    assert redact(src, redacted, {'Alice Smith': '[[PERSON_1]]'}) == {'[[PERSON_1]]': 'Alice Smith'}
+    assert texts(redacted) == ['[[PERSON_1]]']
+
+
+def test_rewrite_docx_refuses_its_own_source(tmp_path):
+    src = make_docx(tmp_path / 'in.docx', paragraph(text('Alice Smith')))
+    with pytest.raises(ValueError):
+        rewrite_docx(src, src, lambda value: [])
+    assert texts(src) == ['Alice Smith']
+
+
+def test_block_ranges_cut_between_top_level_blocks(tmp_path):
+    blocks = [paragraph(text(f'Paragraph {i}')) for i in range(20)]
+    blocks.insert(5, '<w:tbl><w:tr><w:tc>' + paragraph(text('In a table')) * 10 + '</w:tc></w:tr></w:tbl>')
+    src = make_docx(tmp_path / 'in.docx', ''.join(blocks) + '<w:sectPr/>')
+    data = zipfile.ZipFile(src).read('word/document.xml')
+    with zipfile.ZipFile(src).open('word/document.xml') as source:
+        ranges, declarations = block_ranges(source, 200)
+    assert len(ranges) > 2 and declarations == {'xmlns:w': W_NS}
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    assert data[:ranges[0][0]].endswith(b'<w:body>') and data[ranges[-1][1]:] == b'</w:body></w:document>'
+    assert all(data[start:end].startswith((b'<w:p>', b'<w:tbl>')) for start, end in ranges)
+
+
+def test_rewrite_docx_parallel_matches_rewrite_docx(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'REDACT_PART_WORKERS', 2)
+    monkeypatch.setattr(Config, 'REDACT_PART_MIN_BYTES', 500)
+    src = make_docx(tmp_path / 'in.docx', ''.join(
+        paragraph(text(f'Alice Smith {i} '), text('at Acme'), text(' Corp')) for i in range(100)))
+    replacements = {'Alice Smith': '[[PERSON_1]]', 'Acme Corp': '[[ORG_1]]'}
+    expected = str(tmp_path / 'expected.docx')
+    redact(src, expected, replacements)
+    transform = PartTransform(TermMatcher(replacements))
+    rewrite_docx_parallel(src, str(tmp_path / 'parallel.docx'), transform)
+    assert transform.worker_elapsed > 0
+    assert transform.replaced == {'[[PERSON_1]]': 'Alice Smith', '[[ORG_1]]': 'Acme Corp'}
+    assert texts(str(tmp_path / 'parallel.docx')) == texts(expected)
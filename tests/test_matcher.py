@@ -0,0 +1,41 @@
+import random
+
+import matcher
+from matcher import TermMatcher
+
+
+def reference(text, terms):
+    # Leftmost-longest, non-overlapping, by brute force
+    matches = []
+    pos = 0
+    while pos < len(text):
+        found = max((term for term in terms if text.startswith(term, pos)), key=len, default=None)
+        if found:
+            matches.append((pos, pos + len(found), found))
+            pos += len(found)
+        else:
+            pos += 1
+    return matches
+
+
+def test_regex_and_automaton_agree_with_leftmost_longest(monkeypatch):
+    rng = random.Random(3)
+    for _ in range(500):
+        terms = {''.join(rng.choice('ab.') for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 6))}
+        text = ''.join(rng.choice('ab.c') for _ in range(rng.randint(0, 30)))
+        expected = reference(text, terms)
+        assert TermMatcher({term: 'X' for term in terms}).finditer(text) == expected
+        monkeypatch.setattr(matcher, 'REGEX_MAX_TERMS', 0)
+        assert TermMatcher({term: 'X' for term in terms}).finditer(text) == expected
+        monkeypatch.undo()
+
+
+def test_sub_replaces_each_term_once():
+    terms = TermMatcher({'Alice': '[[P1]]', 'Alice Smith': '[[P2]]', 'Smith & Co': '[[O1]]'})
+    assert terms.sub('Alice Smith & Co met Alice.') == ('[[P2]] & Co met [[P1]].', ['Alice Smith', 'Alice'])
+
+
+def test_deeply_nested_terms_fall_back_to_the_automaton():
+    terms = {'a' * n: str(n) for n in range(1, 1500)}
+    found = TermMatcher(terms)
+    assert found.finditer('a' * 3000) == [(0, 1499, 'a' * 1499), (1499, 2998, 'a' * 1499), (2998, 3000, 'aa')]
@@ -0,0 +1,56 @@
+import random
+import re
+
+from document_cache import DocumentIndex, Paragraph
+from search_index import SearchIndex
+
+WORDS = ['shall', 'deliver', 'all', 'Acme', 'a', 'an', 'the']
+
+
+def make_index(texts):
+    return SearchIndex(DocumentIndex([Paragraph('word/document.xml', 'body', text, []) for text in texts]))
+
+
+def scan(texts, query, whole_word):
+    # The index must agree with a regex run over every paragraph
+    pattern = rf'(?<!\w){re.escape(query)}(?!\w)' if whole_word else re.escape(query)
+    return [(i, match.start(), match.end())
+            for i, text in enumerate(texts) for match in re.finditer(pattern, text, re.IGNORECASE)]
+
+
+def random_texts(rng, count):
+    texts = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(0, 12))]
+        texts.append(''.join(word + rng.choice([' ', ' ', ', ', '-']) for word in words))
+    texts.append('İstanbul: shall deliver all, Acme')  # Lowercases to a longer string
+    return texts
+
+
+def test_find_matches_a_regex_scan():
+    rng = random.Random(3)
+    texts = random_texts(rng, 300)
+    index = make_index(texts)
+    queries = ['shall deliver all', 'deliver all', 'a a', 'all, acme', 'shall-deliver', 'ACME', 'the a',
+               'all', 'liver', 'ver al', 'a', 'zz', 'shall deliver all the']
+    for query in queries:
+        for whole_word in (True, False):
+            expected = scan(texts, query, whole_word)
+            assert list(index.find(query, whole_word=whole_word)) == expected, (query, whole_word)
+            assert index.count(query, whole_word=whole_word) == len(expected)
+
+
+def test_search_pages_and_totals():
+    texts = ['shall deliver all of it, shall deliver'] * 40
+    index = make_index(texts)
+    everything = scan(texts, 'shall deliver', True)
+    pages = [index.search('shall deliver', page=page, per_page=30, whole_word=True) for page in (1, 2, 3, 4)]
+    assert [hit for page in pages for hit in page['results']] == [
+        {'paragraph': i + 1, 'part': 'body', 'container': 'body', 'offset': start,
+         'context': texts[i][max(0, start - 20):end + 20]} for i, start, end in everything]
+    # Counting stops with the page: a lower bound until the last page is reached
+    assert (pages[0]['total'], pages[0]['total_exact'], pages[0]['pages']) == (31, False, 2)
+    assert (pages[2]['total'], pages[2]['total_exact'], pages[2]['pages']) == (80, True, 3)
+    assert pages[3]['results'] == [] and pages[3]['total_exact']
+    # One-word queries are counted from their postings
+    assert index.search('shall', per_page=10, whole_word=True)['total'] == 80
@@ -0,0 +1,75 @@
+from chunking import ParagraphSelection
+from gazetteer import uncovered_candidates
+from metrics import REGISTRY, span
+from nlp_pool import RULES, get_pool
+from config import Config
+
+# Tiered NER: a small pipeline (NLP_FAST_MODEL, e.g. en_core_web_sm) or the
+# 'rules' tier reads every paragraph, and only the paragraphs it cannot settle
+# go to the main model. The fast tier's own entities are kept for the rest.
+# The fast pipeline is loaded by the NLP pool next to the main model, so it is
+# preloaded and runs on the same workers.
+
+TIER_PARAGRAPHS = REGISTRY.counter(
+    'redaction_tier_paragraphs_total',
+    'Paragraphs by the NER tier that settled them and why they were escalated.', ['tier', 'reason'])
+TIER_CHARACTERS = REGISTRY.counter(
+    'redaction_tier_characters_total', 'Characters by the NER tier that settled them.', ['tier'])
+
+def tier_id():
+    # Part of the analysis cache key: tiered suggestions depend on all of these
+    if Config.NER_TIERS != 'tiered':
+        return ()
+    return ('tiered', Config.NLP_FAST_MODEL, Config.NER_ESCALATE_DENSITY,
+            ','.join(Config.NER_ESCALATE_LABELS), Config.NER_ESCALATE_UNTAGGED)
+
+
+def escalation_reason(paragraph, entities, rules_only=False):
+    """Why the main model should read this paragraph, or None to trust the fast tier."""
+    if not paragraph.strip():
+        return None
+    if any(label in Config.NER_ESCALATE_LABELS for _, label, _, _, _ in entities):
+        return 'ambiguous'
+    if len(entities) * 100 >= Config.NER_ESCALATE_DENSITY * len(paragraph):
+        return 'dense'
+    if (rules_only or Config.NER_ESCALATE_UNTAGGED) and uncovered_candidates(
+            paragraph, [(start, end) for _, _, start, end, _ in entities]):
+        return 'untagged'
+    return None
+
+
+class Triage:
+    """Fast-tier entities for the paragraphs it settled (offsets in the full
+    text) and the ParagraphSelection left for the main model."""
+
+    def __init__(self, entities, selection):
+        self.entities = entities
+        self.selection = selection
+
+
+def triage(text):
+    paragraphs = text.split('\n')
+    # The rules tier only looks for capitalised words and numbers
+    rules_only = Config.NLP_FAST_MODEL == RULES
+    with span('ner_fast'):
+        if rules_only:
+            found = [[] for _ in paragraphs]
+        else:
+            found = get_pool().extract_fast_entities(paragraphs, Config.NLP_FAST_MODEL)
+
+        entities = []
+        keep = []
+        pos = 0
+        for paragraph, paragraph_entities in zip(paragraphs, found):
+            reason = escalation_reason(paragraph, paragraph_entities, rules_only=rules_only)
+            if reason is None:
+                tier = RULES if rules_only else 'fast'
+                entities.extend((ent_text, label, start + pos, end + pos, confidence)
+                                for ent_text, label, start, end, confidence in paragraph_entities)
+            else:
+                tier = 'main'
+            TIER_PARAGRAPHS.inc(tier=tier, reason=reason or 'settled')
+            TIER_CHARACTERS.inc(len(paragraph), tier=tier)
+            keep.append(reason is not None)
+            pos += len(paragraph) + 1
+    return Triage(entities, ParagraphSelection(text, keep))
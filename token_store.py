@@ -0,0 +1,104 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+DEFAULT_SCOPE = 'global'
+
+
+class TokenMap:
+    """Tokens for one redaction job or tenant.
+
+    Tokens are an HMAC of the term under a key derived from the scope, so any
+    worker or process produces the same token for the same term and scope
+    without sharing state; the map only memoizes them.
+    """
+
+    def __init__(self, scope, secret):
+        self.scope = scope
+        self._key = hmac.new(secret.encode('utf-8'), scope.encode('utf-8'), hashlib.sha256).digest()
+        self._tokens = {}
+        self._terms = {}
+        self._lock = threading.Lock()
+        self.created = self.accessed = time.time()
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def token_for(self, term):
+        with self._lock:
+            self.accessed = time.time()
+            token = self._tokens.get(term)
+            if token is None:
+                digest = hmac.new(self._key, term.encode('utf-8'), hashlib.sha256).hexdigest()
+                # Widen the token on the (rare) collision so the redaction map stays one-to-one
+                length = 8
+                token = f"[[REDACTED_{digest[:length]}]]"
+                while self._terms.get(token, term) != term:
+                    length += 4
+                    token = f"[[REDACTED_{digest[:length]}]]"
+                self._tokens[term] = token
+                self._terms[token] = term
+            return token
+
+
+class TokenStore:
+    """Token maps keyed by scope, evicted least-recently-used and after ttl seconds idle."""
+
+    def __init__(self, secret, max_scopes=1000, ttl=24 * 3600):
+        self.secret = secret
+        self.max_scopes = max_scopes
+        self.ttl = ttl
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, scope=None):
+        scope = scope or DEFAULT_SCOPE
+        with self._lock:
+            token_map = self._maps.get(scope)
+            if token_map is None:
+                self._sweep()
+                token_map = TokenMap(scope, self.secret)
+                self._maps[scope] = token_map
+                while len(self._maps) > self.max_scopes:
+                    self._maps.popitem(last=False)
+            else:
+                self._maps.move_to_end(scope)
+            return token_map
+
+    def discard(self, scope):
+        with self._lock:
+            self._maps.pop(scope, None)
+
+    def sweep(self):
+        with self._lock:
+            self._sweep()
+
+    def _sweep(self):
+        cutoff = time.time() - self.ttl
+        expired = [scope for scope, token_map in self._maps.items() if token_map.accessed < cutoff]
+        for scope in expired:
+            del self._maps[scope]
+
+    def stats(self):
+        with self._lock:
+            return {'scopes': len(self._maps), 'tokens': sum(len(m) for m in self._maps.values())}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_token_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TokenStore(
+                Config.TOKEN_SECRET,
+                max_scopes=Config.TOKEN_STORE_MAX_SCOPES,
+                ttl=Config.TOKEN_STORE_TTL,
+            )
+    return _store
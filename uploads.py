@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from analysis_cache import remember_digest
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only cover threads of one process
+    fcntl = None
+
+# Resumable chunked uploads. Chunks are appended in order to a .part file in
+# UPLOAD_FOLDER next to a small JSON file describing the upload, and hashed as
+# they arrive so the finished document never has to be read again to key the
+# analysis cache. Abandoned uploads are stale files like any other and are
+# removed by the storage sweeper. Several web workers may receive chunks of the
+# same upload, so changes to it hold an flock on its .part file.
+
+UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+COPY_BUFFER = 1024 * 1024
+
+
+class UploadError(Exception):
+    """A rejected upload request; offset is where the client should resume."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class UploadManager:
+    def __init__(self, folder, max_size, chunk_size):
+        self.folder = folder
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        # upload_id -> (bytes hashed, sha256) for uploads this process has received chunks of
+        self._hashers = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, upload_id):
+        if not UPLOAD_ID.match(upload_id or ''):
+            raise UploadError('Unknown upload', 404)
+        base = os.path.join(self.folder, f'partial_{upload_id}')
+        return base + '.part', base + '.json'
+
+    @contextmanager
+    def _upload_lock(self, upload_id):
+        # Threads of this process queue on a Lock, other web workers on an flock of the
+        # .part file, so two chunks for one upload are never checked and appended at once
+        with self._lock:
+            lock = self._locks.setdefault(upload_id, threading.Lock())
+        with lock:
+            part_path, _ = self._paths(upload_id)
+            try:
+                part = open(part_path, 'rb') if fcntl is not None else None
+            except FileNotFoundError:
+                # Completed or discarded meanwhile; status() reports it
+                part = None
+            if part is None:
+                yield
+                return
+            with part:
+                fcntl.flock(part, fcntl.LOCK_EX)
+                yield
+
+    def create(self, filename, size):
+        if size <= 0 or size > self.max_size:
+            raise UploadError(f'Uploads must be between 1 byte and {self.max_size} bytes', 413)
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump({'filename': filename, 'size': size, 'created': time.time()}, f)
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            offset = os.path.getsize(part_path)
+        except FileNotFoundError:
+            raise UploadError('Unknown upload', 404)
+        return {'upload_id': upload_id, 'filename': meta['filename'], 'size': meta['size'],
+                'offset': offset, 'chunk_size': self.chunk_size}
+
+    def _hasher(self, upload_id, part_path, offset):
+        hashed, digest = self._hashers.get(upload_id, (None, None))
+        if hashed != offset:
+            # First chunk seen by this process (another worker, or a restart): catch up from disk
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for block in iter(lambda: f.read(COPY_BUFFER), b''):
+                    digest.update(block)
+        return digest
+
+    def append(self, upload_id, offset, stream):
+        """Append the chunk read from stream at offset, which must be the bytes received so far."""
+        with self._upload_lock(upload_id):
+            upload = self.status(upload_id)
+            if offset != upload['offset']:
+                raise UploadError('Chunk does not start at the current offset', 409, upload['offset'])
+            part_path, _ = self._paths(upload_id)
+            digest = self._hasher(upload_id, part_path, offset)
+            limit = min(self.chunk_size, upload['size'] - offset)
+            written = 0
+            try:
+                with open(part_path, 'ab') as f:
+                    while True:
+                        block = stream.read(COPY_BUFFER)
+                        if not block:
+                            break
+                        if written + len(block) > limit:
+                            f.truncate(offset)
+                            written, digest = 0, None
+                            raise UploadError('Chunk is larger than the chunk size or the rest of the file',
+                                              413, offset)
+                        f.write(block)
+                        digest.update(block)
+                        written += len(block)
+            finally:
+                # After a dropped connection what arrived is kept and the client resumes from there
+                if digest is None:
+                    self._hashers.pop(upload_id, None)
+                else:
+                    self._hashers[upload_id] = (offset + written, digest)
+            upload['offset'] = offset + written
+            return upload
+
+    def complete(self, upload_id, dst_path):
+        """Move a fully received upload to dst_path; returns its SHA-256 hex digest."""
+        with self._upload_lock(upload_id):
+            upload = self.status(upload_id)
+            if upload['offset'] != upload['size']:
+                raise UploadError('Upload is incomplete', 409, upload['offset'])
+            part_path, meta_path = self._paths(upload_id)
+            digest = self._hasher(upload_id, part_path, upload['offset']).hexdigest()
+            os.replace(part_path, dst_path)
+            os.remove(meta_path)
+            self._hashers.pop(upload_id, None)
+        with self._lock:
+            self._locks.pop(upload_id, None)
+        remember_digest(dst_path, digest)
+        return digest
+
+    def discard(self, upload_id):
+        with self._upload_lock(upload_id):
+            for path in self._paths(upload_id):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._hashers.pop(upload_id, None)
+        with self._lock:
+            self._locks.pop(upload_id, None)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_upload_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = UploadManager(Config.UPLOAD_FOLDER, Config.MAX_UPLOAD_SIZE, Config.UPLOAD_CHUNK_SIZE)
+    return _manager